@@ -1,3 +1,6 @@
+import datetime
+import os
+
 import slicer
 
 from slicer.ScriptedLoadableModule import (
@@ -35,6 +38,9 @@ class NavigationWidget(ScriptedLoadableModuleWidget):
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
 
+    # In the order of the pointer dialog combo box
+    POINTER_FILTER_TYPES = ["none", "oneEuro", "kalman"]
+
     def __init__(self, parent):
         super().__init__(parent)
 
@@ -149,7 +155,11 @@ class NavigationWidget(ScriptedLoadableModuleWidget):
 
         tools = slicer.modules.RegistrationWidget.tools
         tools.setToolsStatusCheckEnabled(True)
+        # The tracker starts asynchronously, latency is monitored once it is connected
+        slicer.modules.RegistrationWidget.optitrack.addStateObserver(self.onOptiTrackStateChanged)
         slicer.modules.RegistrationWidget.startOptiTrack()
+        if slicer.modules.RegistrationWidget.optitrack.isConnected:
+            self.startLatencyMonitoring()
 
     def exit(self):
         # Hide current
@@ -174,6 +184,36 @@ class NavigationWidget(ScriptedLoadableModuleWidget):
 
         tools = slicer.modules.RegistrationWidget.tools
         tools.setToolsStatusCheckEnabled(False)
+        slicer.modules.RegistrationWidget.optitrack.removeStateObserver(self.onOptiTrackStateChanged)
+        self.stopLatencyMonitoring()
+
+    def onOptiTrackStateChanged(self, state, message):
+        if slicer.modules.RegistrationWidget.optitrack.isConnected:
+            # Create the pointer nodes now rather than on the deferred reconnection of the registration widget
+            slicer.modules.RegistrationWidget.logic.reconnect()
+            self.startLatencyMonitoring()
+
+    def startLatencyMonitoring(self):
+        registrationLogic = slicer.modules.RegistrationWidget.logic
+        if not registrationLogic.pointer_to_headframe:
+            print("Tracker not connected, latency not monitored")
+            return
+        latencyMonitor = slicer.modules.RegistrationWidget.optitrack.latencyMonitor
+        if latencyMonitor.isMonitoring:
+            # Keep the statistics collected before a reconnection
+            return
+        latencyMonitor.start(registrationLogic.pointer_to_headframe, registrationLogic.pointer_calibration)
+
+    def stopLatencyMonitoring(self):
+        latencyMonitor = slicer.modules.RegistrationWidget.optitrack.latencyMonitor
+        if not latencyMonitor.isMonitoring:
+            return
+        latencyMonitor.stop()
+        print(latencyMonitor.summaryText())
+        trackingDirectory = OpenNavUtils.caseSubdirectory(slicer.modules.PlanningWidget.logic.case_name, "Tracking")
+        if trackingDirectory and latencyMonitor.arrivalCount:
+            fileName = "Latency-" + datetime.datetime.now().strftime("%Y-%m-%d_T%H-%M-%S") + ".json"
+            latencyMonitor.dump(os.path.join(trackingDirectory, fileName))
 
     def disconnectAll(self, widget):
         try:
@@ -191,11 +231,35 @@ class NavigationWidget(ScriptedLoadableModuleWidget):
         self.pointerDialog = slicer.util.loadUI(self.resourcePath("UI/PointerDialog.ui"))
         self.pointerDialogUI = slicer.util.childWidgetVariables(self.pointerDialog)
         self.pointerDialogUI.PointerLengthSpinBox.valueChanged.connect(self.onPointerExtensionChanged)
-        self.pointerButton.clicked.connect(lambda: self.pointerDialog.exec())
+        self.pointerDialogUI.PointerFilterComboBox.currentIndexChanged.connect(self.onPointerFilterChanged)
+        self.pointerDialogUI.PointerPredictionSpinBox.valueChanged.connect(self.onPointerFilterChanged)
+        self.pointerButton.clicked.connect(self.showPointerDialog)
+
+    def showPointerDialog(self):
+        settings = slicer.modules.RegistrationWidget.logic.pointerFilterSettings()
+        self.pointerDialogUI.PointerFilterComboBox.blockSignals(True)
+        self.pointerDialogUI.PointerPredictionSpinBox.blockSignals(True)
+        self.pointerDialogUI.PointerFilterComboBox.currentIndex = self.POINTER_FILTER_TYPES.index(settings.get("type", "none"))
+        self.pointerDialogUI.PointerPredictionSpinBox.value = round(settings.get("prediction", 0.0) * 1000)
+        self.pointerDialogUI.PointerPredictionSpinBox.enabled = settings.get("type", "none") != "none"
+        self.pointerDialogUI.PointerFilterComboBox.blockSignals(False)
+        self.pointerDialogUI.PointerPredictionSpinBox.blockSignals(False)
+        self.pointerDialog.exec()
 
     def onPointerExtensionChanged(self, value):
         slicer.modules.RegistrationWidget.logic.updateExtensionModels(length=value)
 
+    def onPointerFilterChanged(self):
+        registrationLogic = slicer.modules.RegistrationWidget.logic
+        filterType = self.POINTER_FILTER_TYPES[self.pointerDialogUI.PointerFilterComboBox.currentIndex]
+        settings = registrationLogic.pointerFilterSettings()
+        if settings.get("type") != filterType:
+            settings = {"type": filterType}
+        if filterType != "none":
+            settings["prediction"] = self.pointerDialogUI.PointerPredictionSpinBox.value / 1000.0
+        self.pointerDialogUI.PointerPredictionSpinBox.enabled = filterType != "none"
+        registrationLogic.setPointerFilterSettings(settings)
+
     def changeLayout(self):
         planningLogic = slicer.modules.PlanningWidget.logic
         try:
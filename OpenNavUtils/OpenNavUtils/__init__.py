@@ -66,6 +66,7 @@ from .layout import (  # noqa: F401
 )
 
 from .autosave import (  # noqa: F401
+    caseSubdirectory,
     deleteAutoSave,
     slugify,
     autoSavePlan,
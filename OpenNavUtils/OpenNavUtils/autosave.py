@@ -29,6 +29,19 @@ def _autoSaveFilePath(caseName):
     return os.path.join(_autoSaveDirectory(caseName), path)
 
 
+def caseSubdirectory(caseName, name):
+    """Return the path of a subdirectory of an existing case directory, creating it if needed.
+
+    Return None if the case has not been saved yet, so that the first autosave of
+    the case is not mistaken for an incremental one.
+    """
+    if not caseName or not os.path.exists(_autoSaveDirectory(caseName)):
+        return None
+    path = os.path.join(_autoSaveDirectory(caseName), name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 def deleteAutoSave(caseName):
     if os.path.exists(_autoSaveDirectory(caseName)):
         import shutil
@@ -1,4 +1,9 @@
 import os
+import shutil
+import sys
+import time
+
+from enum import Enum
 
 import ctk
 import qt
@@ -9,6 +14,10 @@ from slicer.ScriptedLoadableModule import (
     ScriptedLoadableModuleLogic,
     ScriptedLoadableModuleWidget,
 )
+from slicer.util import VTKObservationMixin
+
+import OptiTrackUtils
+from OptiTrackUtils import ConnectionManager, LatencyMonitor, Metric, MetricsExporter, NodeRegistry, PlusConfigError, PlusConfigManager, ProcessSupervisor, SessionPlayer, SessionRecorder, TrackerFusion, TrackerSource
 
 
 #
@@ -48,11 +57,14 @@ class OptiTrackWidget(ScriptedLoadableModuleWidget):
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
 
+    REPLAY_SPEEDS = [("Real-time", 1.0), ("2x", 2.0), ("10x", 10.0), ("As fast as possible", None)]
+    # Metrics file written while the application runs, e.g. in the node-exporter textfile directory
+    METRICS_PATH_SETTING = "OpenNav/MetricsFilePath"
+
     def setup(self):
         ScriptedLoadableModuleWidget.setup(self)
 
         self.logic = OptiTrackLogic()
-        self.logic.expectedNodes(["ReferenceToTracker", "LongToolToTracker", "ShortToolToTracker"])
 
         # Instantiate and connect widgets ...
 
@@ -87,33 +99,213 @@ class OptiTrackWidget(ScriptedLoadableModuleWidget):
         self.applyButton.enabled = True
         parametersFormLayout.addRow(self.applyButton)
 
+        #
+        # Simulator Area
+        #
+        simulatorCollapsibleButton = ctk.ctkCollapsibleButton()
+        simulatorCollapsibleButton.text = "Tracker simulator"
+        simulatorCollapsibleButton.collapsed = True
+        self.layout.addWidget(simulatorCollapsibleButton)
+        simulatorFormLayout = qt.QFormLayout(simulatorCollapsibleButton)
+
+        self.simulatorRateSpinBox = qt.QDoubleSpinBox()
+        self.simulatorRateSpinBox.setRange(30, 1000)
+        self.simulatorRateSpinBox.value = 120
+        self.simulatorRateSpinBox.suffix = " Hz"
+        simulatorFormLayout.addRow("Rate:", self.simulatorRateSpinBox)
+
+        self.simulatorJitterSpinBox = qt.QDoubleSpinBox()
+        self.simulatorJitterSpinBox.setRange(0, 10)
+        self.simulatorJitterSpinBox.singleStep = 0.1
+        self.simulatorJitterSpinBox.suffix = " mm"
+        simulatorFormLayout.addRow("Position jitter:", self.simulatorJitterSpinBox)
+
+        self.simulatorDropoutSpinBox = qt.QDoubleSpinBox()
+        self.simulatorDropoutSpinBox.setRange(0, 10)
+        self.simulatorDropoutSpinBox.singleStep = 0.1
+        self.simulatorDropoutSpinBox.suffix = " /s"
+        simulatorFormLayout.addRow("Dropout rate:", self.simulatorDropoutSpinBox)
+
+        self.simulatorToolsSpinBox = qt.QSpinBox()
+        self.simulatorToolsSpinBox.setRange(0, 20)
+        simulatorFormLayout.addRow("Extra tools:", self.simulatorToolsSpinBox)
+
+        self.simulatorButton = qt.QPushButton("Start Simulator")
+        self.simulatorButton.toolTip = "Stream simulated tool transforms instead of launching PlusServer."
+        simulatorFormLayout.addRow(self.simulatorButton)
+
+        #
+        # Replay Area
+        #
+        replayCollapsibleButton = ctk.ctkCollapsibleButton()
+        replayCollapsibleButton.text = "Tracking session replay"
+        replayCollapsibleButton.collapsed = True
+        self.layout.addWidget(replayCollapsibleButton)
+        replayFormLayout = qt.QFormLayout(replayCollapsibleButton)
+
+        self.replayPathEdit = ctk.ctkPathLineEdit()
+        self.replayPathEdit.nameFilters = ["Tracking session (*.trk)"]
+        replayFormLayout.addRow("Session file:", self.replayPathEdit)
+
+        self.replaySpeedComboBox = qt.QComboBox()
+        for label, speed in self.REPLAY_SPEEDS:
+            self.replaySpeedComboBox.addItem(label, speed)
+        replayFormLayout.addRow("Speed:", self.replaySpeedComboBox)
+
+        self.replayButton = qt.QPushButton("Start Replay")
+        self.replayButton.toolTip = "Replay the recorded transforms directly into the scene."
+        replayFormLayout.addRow(self.replayButton)
+
+        #
+        # Latency Area
+        #
+        latencyCollapsibleButton = ctk.ctkCollapsibleButton()
+        latencyCollapsibleButton.text = "Tracking latency"
+        latencyCollapsibleButton.collapsed = True
+        self.layout.addWidget(latencyCollapsibleButton)
+        latencyFormLayout = qt.QFormLayout(latencyCollapsibleButton)
+
+        self.latencyLabel = qt.QLabel("Latency is measured during navigation.")
+        latencyFormLayout.addRow(self.latencyLabel)
+
+        self.latencyTimer = qt.QTimer()
+        self.latencyTimer.interval = 1000
+        self.latencyTimer.timeout.connect(self.updateLatencyDisplay)
+        latencyCollapsibleButton.connect("contentsCollapsed(bool)", self.onLatencyCollapsed)
+
+        #
+        # Metrics Area
+        #
+        metricsCollapsibleButton = ctk.ctkCollapsibleButton()
+        metricsCollapsibleButton.text = "Metrics export"
+        metricsCollapsibleButton.collapsed = True
+        self.layout.addWidget(metricsCollapsibleButton)
+        metricsFormLayout = qt.QFormLayout(metricsCollapsibleButton)
+
+        self.metricsPathEdit = ctk.ctkPathLineEdit()
+        self.metricsPathEdit.filters = ctk.ctkPathLineEdit.Files | ctk.ctkPathLineEdit.Writable
+        self.metricsPathEdit.nameFilters = ["Prometheus text file (*.prom)"]
+        self.metricsPathEdit.currentPath = qt.QSettings().value(self.METRICS_PATH_SETTING) or ""
+        self.metricsPathEdit.toolTip = "Metrics are written to this file every 15 s, from now on and when the application starts."
+        metricsFormLayout.addRow("Metrics file:", self.metricsPathEdit)
+
+        self.metricsButton = qt.QPushButton()
+        metricsFormLayout.addRow(self.metricsButton)
+        self.updateMetricsButton()
+
         # connections
         self.applyButton.connect("clicked(bool)", self.onApplyButton)
+        self.metricsButton.connect("clicked(bool)", self.onMetricsButton)
+        self.simulatorButton.connect("clicked(bool)", self.onSimulatorButton)
+        self.replayButton.connect("clicked(bool)", self.onReplayButton)
+        self.logic.player.onFinished = self.onReplayFinished
+        self.logic.addStateObserver(self.onStateChanged)
 
         # Add vertical spacer
         self.layout.addStretch(1)
 
     def cleanup(self):
+        self.latencyTimer.stop()
+        self.logic.removeStateObserver(self.onStateChanged)
         self.logic.shutdown()
 
     def onApplyButton(self):
-        self.applyButton.enabled = False
-        self.applyButton.text = "OptiTrack is starting..."
-        slicer.app.processEvents()
+        if self.logic.isStarting:
+            self.logic.cancelStartup()
+            return
+        # The panel streams whatever the selected template sends, only the template itself is validated
+        try:
+            self.logic.setExpectedNodes(self.logic.templateTransformNames(self.configPathEdit.currentPath))
+        except (OSError, PlusConfigError):
+            # Reported when starting
+            self.logic.setExpectedNodes([])
         self.logic.start(self.launcherPathEdit.currentPath, self.configPathEdit.currentPath, self.dataPathEdit.currentPath)
-        self.applyButton.enabled = True
+
+    def onSimulatorButton(self):
+        if self.logic.isStarting:
+            self.logic.cancelStartup()
+            return
         if self.logic.isRunning:
+            self.logic.shutdown()
+            return
+        self.logic.startSimulator(
+            rate=self.simulatorRateSpinBox.value,
+            positionJitter=self.simulatorJitterSpinBox.value,
+            dropoutRate=self.simulatorDropoutSpinBox.value,
+            extraTools=self.simulatorToolsSpinBox.value,
+        )
+
+    def onLatencyCollapsed(self, collapsed):
+        if collapsed:
+            self.latencyTimer.stop()
+        else:
+            self.updateLatencyDisplay()
+            self.latencyTimer.start()
+
+    def updateLatencyDisplay(self):
+        self.latencyLabel.text = self.workflowLogic().latencyMonitor.summaryText()
+
+    def workflowLogic(self):
+        # The tracker used by the workflow is owned by the Registration module
+        registrationWidget = getattr(slicer.modules, "RegistrationWidget", None)
+        return registrationWidget.optitrack if registrationWidget else self.logic
+
+    def updateMetricsButton(self):
+        self.metricsButton.text = "Stop Metrics Export" if self.workflowLogic().metricsExporter.isExporting else "Start Metrics Export"
+
+    def onMetricsButton(self):
+        logic = self.workflowLogic()
+        if logic.metricsExporter.isExporting:
+            logic.stopMetricsExport()
+            qt.QSettings().remove(self.METRICS_PATH_SETTING)
+        elif self.metricsPathEdit.currentPath:
+            logic.startMetricsExport(self.metricsPathEdit.currentPath)
+            qt.QSettings().setValue(self.METRICS_PATH_SETTING, self.metricsPathEdit.currentPath)
+        self.updateMetricsButton()
+
+    def onReplayButton(self):
+        if self.logic.player.isPlaying:
+            self.logic.stopReplay()
+            self.onReplayFinished()
+            return
+        speed = self.REPLAY_SPEEDS[self.replaySpeedComboBox.currentIndex][1]
+        self.logic.startReplay(self.replayPathEdit.currentPath, speed)
+        self.replayButton.text = "Stop Replay"
+
+    def onReplayFinished(self):
+        self.replayButton.text = "Start Replay"
+
+    def onStateChanged(self, state, message):
+        if state in (OptiTrackState.LAUNCHING, OptiTrackState.CONNECTING):
+            self.applyButton.text = f"{message} (click to cancel)"
+        elif state == OptiTrackState.CONNECTED:
             self.applyButton.text = "Stop OptiTrack"
+        elif state == OptiTrackState.RECONNECTING:
+            self.applyButton.text = "Stop OptiTrack (reconnecting...)"
         else:
             self.applyButton.text = "Start OptiTrack"
 
 
+#
+# OptiTrackState
+#
+
+
+class OptiTrackState(Enum):
+    IDLE = 0
+    LAUNCHING = 1
+    CONNECTING = 2
+    CONNECTED = 3
+    FAILED = 4
+    RECONNECTING = 5
+
+
 #
 # OptiTrackLogic
 #
 
 
-class OptiTrackLogic(ScriptedLoadableModuleLogic):
+class OptiTrackLogic(VTKObservationMixin, ScriptedLoadableModuleLogic):
     """This class should implement all the actual
     computation done by your module.  The interface
     should be such that other python code can import
@@ -123,38 +315,231 @@ class OptiTrackLogic(ScriptedLoadableModuleLogic):
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
 
+    STARTUP_TIMEOUT_SEC = 30
+    STARTUP_CHECK_INTERVAL_MS = 100
+    # Namespace of the PlusServer connection among tracker sources
+    PRIMARY_SOURCE_NAME = "OptiTrack"
+
     def __init__(self):
+        VTKObservationMixin.__init__(self)
         self.connector = None
         self.isRunning = False
         self.expectedNodes = []
+        self.state = OptiTrackState.IDLE
+        self.stateObservers = []
+        self.startupStartTime = None
+
+        self.startupTimer = qt.QTimer()
+        self.startupTimer.interval = self.STARTUP_CHECK_INTERVAL_MS
+        self.startupTimer.timeout.connect(self.checkStartup)
+
+        self.connectionManager = ConnectionManager(onDisconnected=self.onConnectionLost, onReconnected=self.onConnectionRestored)
+        self.recorder = SessionRecorder()
+        self.player = SessionPlayer()
+        self.latencyMonitor = LatencyMonitor()
+        self.configManager = None
+        self.processSupervisor = ProcessSupervisor("PlusServer", onExited=self.onServerExited)
+        self.sources = {}
+        self.fusion = TrackerFusion()
+        self.nodeRegistry = NodeRegistry()
+        self.metricsExporter = MetricsExporter()
+        self.metricsExporter.addCollector(self.collectMetrics)
 
     def setExpectedNodes(self, expectedNodes):
         self.expectedNodes = expectedNodes
 
+    @property
+    def isStarting(self):
+        return self.state in (OptiTrackState.LAUNCHING, OptiTrackState.CONNECTING)
+
+    @property
+    def isConnected(self):
+        return self.state == OptiTrackState.CONNECTED
+
+    def addStateObserver(self, callback):
+        """Register ``callback(state, message)``, called on every :class:`OptiTrackState` transition."""
+        if callback not in self.stateObservers:
+            self.stateObservers.append(callback)
+
+    def removeStateObserver(self, callback):
+        if callback in self.stateObservers:
+            self.stateObservers.remove(callback)
+
+    def setState(self, state, message=""):
+        self.state = state
+        print(f"OptiTrack {state.name}: {message}")
+        for callback in list(self.stateObservers):
+            callback(state, message)
+
     def shutdown(self, clean=False):
+        self.startupTimer.stop()
+        self.connectionManager.stopSupervising()
+        self.stopRecording()
+        self.latencyMonitor.stop()
+        self.fusion.stop()
+        for source in self.sources.values():
+            source.stop()
+        if self.connector:
+            self.removeObserver(self.connector, slicer.vtkMRMLIGTLConnectorNode.ConnectedEvent, self.onConnectorConnected)
         if self.isRunning:
             self.connector.Stop()
             self.p.terminate()
+            self.processSupervisor.stop()
             self.isRunning = False
-            import shutil
-
             shutil.rmtree(self.tempDirectory)
             print("Shutdown")
             if clean:
                 self.cleanupNodes()
+                self.fusion.clear()
+        if self.state not in (OptiTrackState.IDLE, OptiTrackState.FAILED):
+            self.setState(OptiTrackState.IDLE, "Stopped")
+
+    def addTrackerSource(self, name, port, expectedNodes, host="localhost", timeOffset=0.0, command=None, deviceNamePrefix=None):
+        """Add a tracker connection next to PlusServer, e.g. an EM tracker.
+
+        The source is connected, and its server launched if ``command`` is given, together
+        with PlusServer, or immediately if PlusServer is already running. Its device names
+        must be prefixed, so that its nodes do not collide with the PlusServer nodes or
+        those of other sources. See :class:`OptiTrackUtils.TrackerSource` for the parameters.
+        """
+        if name == self.PRIMARY_SOURCE_NAME or name in self.sources:
+            raise ValueError(f"Tracker source {name} already exists")
+        source = TrackerSource(name, port, expectedNodes, host=host, timeOffset=timeOffset, command=command, deviceNamePrefix=deviceNamePrefix)
+        if not source.deviceNamePrefix:
+            raise ValueError(f"Tracker source {name} needs a device name prefix")
+        for other in self.sources.values():
+            if source.deviceNamePrefix.startswith(other.deviceNamePrefix) or other.deviceNamePrefix.startswith(source.deviceNamePrefix):
+                raise ValueError(f"Device name prefix {source.deviceNamePrefix} of tracker source {name} overlaps with tracker source {other.name}")
+        self.sources[name] = source
+        if self.isRunning:
+            source.start(self.logDirectory())
+        return source
+
+    def removeTrackerSource(self, name):
+        source = self.sources.pop(name)
+        source.cleanup()
+
+    def sourceNode(self, sourceName, nodeName):
+        """Return the node ``nodeName`` received from a tracker source, or None if not received yet."""
+        if sourceName == self.PRIMARY_SOURCE_NAME:
+            if nodeName not in self.expectedNodes:
+                return None
+            node = self.nodeRegistry.node(nodeName)
+            # An unprefixed device of another source may have the same name
+            if node is None or node.GetAttribute("OpenNav.TrackerSource") is not None:
+                return None
+            return node
+        return self.sources[sourceName].node(nodeName)
+
+    def fuseNode(self, outputName, sourceName, nodeName):
+        """Create a node ``outputName`` following ``nodeName`` of a source on the common fusion clock.
+
+        Fused nodes of different sources describe the same instant, see :class:`OptiTrackUtils.TrackerFusion`.
+        """
+        timeOffset = 0.0 if sourceName == self.PRIMARY_SOURCE_NAME else self.sources[sourceName].timeOffset
+        outputNode = self.fusion.addInput(outputName, lambda: self.sourceNode(sourceName, nodeName), timeOffset)
+        if self.isRunning:
+            self.fusion.start()
+        return outputNode
+
+    def startMetricsExport(self, path, interval=MetricsExporter.DEFAULT_INTERVAL_SEC):
+        """Write tracker health metrics to ``path`` every ``interval`` seconds, see :class:`OptiTrackUtils.MetricsExporter`.
+
+        Other modules can add their metrics with ``metricsExporter.addCollector``.
+        """
+        self.metricsExporter.start(path, interval)
+
+    def stopMetricsExport(self):
+        self.metricsExporter.stop()
+
+    def collectMetrics(self):
+        """Return the tracker connection, PlusServer process and latency metrics."""
+        stateMetric = Metric("opennav_tracker_state", "gauge", "Tracker connection state, 1 for the current state.")
+        for state in OptiTrackState:
+            stateMetric.add(1 if state == self.state else 0, state=state.name)
+        metrics = [
+            stateMetric,
+            Metric("opennav_tracker_connected", "gauge", "Whether the OpenIGTLink connector is connected.").add(
+                1 if self.connector and self.connector.GetState() == slicer.vtkMRMLIGTLConnectorNode.StateConnected else 0,
+            ),
+            Metric("opennav_tracker_reconnects_total", "counter", "Connections restored after an outage.").add(self.connectionManager.reconnectCount),
+            Metric("opennav_tracker_outage_seconds_total", "counter", "Time spent disconnected after an outage.").add(self.connectionManager.totalOutageTime()),
+            Metric("opennav_plusserver_uptime_seconds", "gauge", "Time since the tracker server was launched, 0 if not running.").add(self.processSupervisor.uptime),
+        ]
+
+        usage = self.processSupervisor.latestUsage() if self.processSupervisor.isRunning else None
+        if usage is not None:
+            metrics.append(Metric("opennav_plusserver_cpu_percent", "gauge", "Tracker server CPU usage, in percent of one core.").add(usage[0]))
+            metrics.append(Metric("opennav_plusserver_memory_bytes", "gauge", "Tracker server resident memory.").add(usage[1]))
+
+        if self.sources:
+            sourceMetric = Metric("opennav_tracker_source_connected", "gauge", "Whether an additional tracker source is connected.")
+            for name, source in self.sources.items():
+                sourceMetric.add(1 if source.isConnected else 0, source=name)
+            metrics.append(sourceMetric)
+
+        latency = self.latencyMonitor.summary()
+        latencyMetric = Metric("opennav_tracking_latency_seconds", "summary", "Latency from pose arrival to each display stage, over the last poses.")
+        for stage in self.latencyMonitor.STAGES:
+            stageSummary = latency[stage]
+            for percentile in self.latencyMonitor.PERCENTILES:
+                if f"p{percentile}" in stageSummary:
+                    latencyMetric.add(stageSummary[f"p{percentile}"] / 1000.0, stage=stage, quantile=percentile / 100.0)
+            latencyMetric.add(stageSummary["count"], suffix="_count", stage=stage)
+        metrics.append(latencyMetric)
+        return metrics
+
+    def logDirectory(self):
+        return os.path.join(self.getTempDirectoryBase(), "Logs")
+
+    def startRecording(self, path):
+        """Record every update of the expected nodes to a tracking session file.
+
+        See :func:`OptiTrackUtils.readTrackingSession` to load it.
+        """
+        self.recorder.start(path, self.expectedNodes)
+
+    def stopRecording(self):
+        self.recorder.stop()
+
+    def startReplay(self, path, speed=1.0):
+        """Replay a tracking session into the expected nodes, without PlusServer.
+
+        ``speed`` is relative to the recording (1.0 is real-time), ``None`` replays as
+        fast as possible. Use :attr:`player` to pause or seek.
+        """
+        if self.isRunning:
+            self.shutdown()
+        self.player.load(path, self.expectedNodes)
+        self.checkNodes()
+        self.player.play(speed)
+
+    def stopReplay(self):
+        self.player.stop()
 
     def writeConfigFile(self, configTemplateFileName, dataFileName):
-        template = ""
-        with open(configTemplateFileName) as fh:
-            template = fh.read()
-
-        configData = template.format(dataFileName)
-        configDataFileName = os.path.join(self.tempDirectory, "Temp.xml")
-        with open(configDataFileName, "w") as fh:
-            fh.write(configData)
+        """Return the path of the PlusServer configuration for a template and a data file.
+
+        Rendered configurations are cached across restarts, see :class:`OptiTrackUtils.PlusConfigManager`.
+        Raise :class:`OptiTrackUtils.PlusConfigError` if the template does not provide the expected nodes.
+        """
+        configDataFileName = self.getConfigManager().render(configTemplateFileName, dataFileName, self.expectedNodes)
         print(configDataFileName)
         return configDataFileName
 
+    def templateTransformNames(self, configTemplateFileName):
+        """Return the names of the transforms sent by PlusServer with a configuration template.
+
+        Raise :class:`OptiTrackUtils.PlusConfigError` if the template is invalid.
+        """
+        _, transformNames = self.getConfigManager().loadTemplate(configTemplateFileName)
+        return transformNames
+
+    def getConfigManager(self):
+        if self.configManager is None:
+            self.configManager = PlusConfigManager(os.path.join(self.getTempDirectoryBase(), "Configs"))
+        return self.configManager
+
     def getPlusLauncherPath(self):
         basepath = ""
         for item in os.listdir(os.path.expanduser("~")):
@@ -182,13 +567,11 @@ class OptiTrackLogic(ScriptedLoadableModuleLogic):
         return dirPath
 
     def checkNode(self, nodeName):
-        try:
-            node = slicer.util.getNode(nodeName)
-            node.CreateDefaultDisplayNodes()
-            node.SaveWithSceneOff()
-            return True
-        except:
+        node = self.nodeRegistry.node(nodeName)
+        if node is None:
             return False
+        self.nodeRegistry.prepare(node)
+        return True
 
     def checkNodes(self, nodesList=None):
         if nodesList is None:
@@ -203,44 +586,139 @@ class OptiTrackLogic(ScriptedLoadableModuleLogic):
             self.cleanupNode(nodeName)
 
     def cleanupNode(self, nodeName):
-        try:
-            node = slicer.util.getNode(nodeName)
+        node = self.nodeRegistry.node(nodeName)
+        if node is not None:
             slicer.mrmlScene.RemoveNode(node)
-        except:
-            pass
 
     def start(self, plusLauncherPath, plusConfigTemplatePath, plusDataPath):
-        import time
+        """Launch PlusServer and connect to it, or shut it down if it is already running.
+
+        Startup is asynchronous: this returns as soon as the server process is launched.
+        Progress is reported through the state observers (see :func:`addStateObserver`),
+        ending in either :attr:`OptiTrackState.CONNECTED` or :attr:`OptiTrackState.FAILED`.
+        Use :func:`cancelStartup` to abort a pending startup.
+        """
+        if self.isStarting:
+            print("OptiTrack startup already in progress")
+            return
+
+        if self.isRunning:
+            self.shutdown()
+            return
 
+        self.setState(OptiTrackState.LAUNCHING, "Launching PlusServer")
+        try:
+            plusConfigPath = self.writeConfigFile(plusConfigTemplatePath, plusDataPath)
+        except PlusConfigError as e:
+            self.failStartup(f"Invalid PlusServer configuration: {e}")
+            return
         self.tempDirectory = self.createTempDirectory()
-        plusConfigPath = self.writeConfigFile(plusConfigTemplatePath, plusDataPath)
-        if not self.isRunning:
-            self.isRunning = True
-            self.p = slicer.util.launchConsoleProcess([plusLauncherPath, "--config-file=" + plusConfigPath])
-            self.p.poll()
-
-            if not self.connector:
-                self.connector = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLIGTLConnectorNode")
-                self.connector.SetTypeClient("localhost", 18944)
-            self.connector.Start()
-
-            connected = False
-            # wait max 30 seconds for connection:
-            start = time.time()
-            while not connected and time.time() - start < 30:
-                slicer.app.processEvents()
-                if self.connector.GetState() == slicer.vtkMRMLIGTLConnectorNode.StateConnected:
-                    connected = True
-                    break
-                time.sleep(0.1)
-
-            if not connected:
-                print("Server failed to launch:")
-                self.shutdown()
-                output = self.p.stdout.read()
-                print(output)
-                return
-            print("PLUS Server launched")
-            self.checkNodes()
-        else:
+        self.launchServer([plusLauncherPath, "--config-file=" + plusConfigPath])
+
+    def startSimulator(self, rate=120.0, positionJitter=0.0, timingJitter=0.0, dropoutRate=0.0, dropoutDuration=0.2, extraTools=0):
+        """Launch the local tracker simulator instead of PlusServer and connect to it.
+
+        The simulator runs in its own PythonSlicer process and sends the same transforms
+        as PlusServer. See :mod:`OptiTrackUtils.TrackerSimulator` for the parameters.
+        """
+        if self.isStarting:
+            print("OptiTrack startup already in progress")
+            return
+
+        if self.isRunning:
             self.shutdown()
+
+        self.setState(OptiTrackState.LAUNCHING, "Launching tracker simulator")
+        self.tempDirectory = self.createTempDirectory()
+        pythonPath = shutil.which("PythonSlicer") or sys.executable
+        simulatorPath = os.path.join(os.path.dirname(OptiTrackUtils.__file__), "TrackerSimulator.py")
+        self.launchServer(
+            [
+                pythonPath,
+                simulatorPath,
+                f"--rate={rate}",
+                f"--jitter={positionJitter}",
+                f"--timing-jitter={timingJitter}",
+                f"--dropout-rate={dropoutRate}",
+                f"--dropout-duration={dropoutDuration}",
+                f"--extra-tools={extraTools}",
+            ],
+        )
+
+    def launchServer(self, command):
+        try:
+            self.p = slicer.util.launchConsoleProcess(command)
+        except OSError as e:
+            self.failStartup(f"{command[0]} could not be launched: {e}")
+            return
+        self.isRunning = True
+        # Logs are kept after shutdown, unlike the temp directory
+        self.processSupervisor.start(self.p, os.path.join(self.logDirectory(), "PlusServer.log"))
+        for source in self.sources.values():
+            source.start(self.logDirectory())
+        if self.fusion.inputs:
+            self.fusion.start()
+
+        if not self.connector:
+            self.connector = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLIGTLConnectorNode")
+            self.connector.SetTypeClient("localhost", 18944)
+        self.addObserver(self.connector, slicer.vtkMRMLIGTLConnectorNode.ConnectedEvent, self.onConnectorConnected)
+        self.connector.Start()
+
+        self.startupStartTime = time.monotonic()
+        self.setState(OptiTrackState.CONNECTING, "Connecting to PlusServer")
+        self.startupTimer.start()
+
+    def cancelStartup(self):
+        if not self.isStarting:
+            return
+        self.state = OptiTrackState.IDLE
+        self.shutdown()
+        self.setState(OptiTrackState.IDLE, "Startup cancelled")
+
+    def checkStartup(self):
+        if not self.isStarting:
+            self.startupTimer.stop()
+            return
+
+        if self.connector.GetState() == slicer.vtkMRMLIGTLConnectorNode.StateConnected:
+            self.onConnectorConnected()
+        elif self.p.poll() is not None:
+            self.failStartup(f"Server exited with code {self.p.returncode}")
+        elif time.monotonic() - self.startupStartTime > self.STARTUP_TIMEOUT_SEC:
+            self.failStartup(f"No connection after {self.STARTUP_TIMEOUT_SEC} seconds")
+
+    def onConnectorConnected(self, caller=None, event=None):
+        if not self.isStarting:
+            return
+        self.startupTimer.stop()
+        print("PLUS Server launched")
+        self.checkNodes()
+        self.connectionManager.startSupervising(self.connector)
+        self.setState(OptiTrackState.CONNECTED, f"Connected in {time.monotonic() - self.startupStartTime:.1f} s")
+
+    def onConnectionLost(self):
+        self.setState(OptiTrackState.RECONNECTING, "Connection to PlusServer lost, reconnecting")
+
+    def onConnectionRestored(self):
+        self.checkNodes()
+        outage = self.connectionManager.outages[-1]
+        self.setState(OptiTrackState.CONNECTED, f"Reconnected after {outage['duration']:.1f} s")
+
+    def onServerExited(self, returnCode):
+        # Exits during startup are reported by checkStartup
+        if self.state not in (OptiTrackState.CONNECTED, OptiTrackState.RECONNECTING):
+            return
+        print(self.processSupervisor.outputText(lineCount=50))
+        self.state = OptiTrackState.FAILED
+        self.shutdown()
+        self.setState(OptiTrackState.FAILED, f"Server exited with code {returnCode}")
+
+    def failStartup(self, message):
+        print("Server failed to launch:")
+        self.state = OptiTrackState.FAILED
+        wasRunning = self.isRunning
+        self.shutdown()
+        if wasRunning:
+            print(self.processSupervisor.outputText())
+        self.setState(OptiTrackState.FAILED, message)
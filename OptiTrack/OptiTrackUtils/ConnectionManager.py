@@ -0,0 +1,106 @@
+import time
+
+import qt
+import slicer
+
+from slicer.util import VTKObservationMixin
+
+
+class ConnectionManager(VTKObservationMixin):
+    """Supervise an OpenIGTLink connector and reconnect it after a disconnect.
+
+    Reconnection attempts restart the connector with an exponential backoff,
+    from :attr:`INITIAL_BACKOFF_SEC` up to :attr:`MAX_BACKOFF_SEC`, until the
+    connection is restored or supervision is stopped. Each outage is recorded
+    in :attr:`outages` with its start time (seconds since epoch) and duration.
+    """
+
+    INITIAL_BACKOFF_SEC = 0.5
+    MAX_BACKOFF_SEC = 10.0
+
+    def __init__(self, onDisconnected=None, onReconnected=None):
+        super().__init__()
+        self.connector = None
+        self.onDisconnected = onDisconnected
+        self.onReconnected = onReconnected
+        self.outages = []
+        self.reconnectCount = 0
+        self.outageStartTime = None
+        self.outageStartWallTime = None
+        self.backoff = self.INITIAL_BACKOFF_SEC
+
+        self.reconnectTimer = qt.QTimer()
+        self.reconnectTimer.singleShot = True
+        self.reconnectTimer.timeout.connect(self.attemptReconnect)
+
+    @property
+    def isSupervising(self):
+        return self.connector is not None
+
+    @property
+    def inOutage(self):
+        return self.outageStartTime is not None
+
+    def startSupervising(self, connector):
+        self.stopSupervising()
+        self.connector = connector
+        self.addObserver(connector, slicer.vtkMRMLIGTLConnectorNode.DisconnectedEvent, self.onConnectorDisconnected)
+        self.addObserver(connector, slicer.vtkMRMLIGTLConnectorNode.ConnectedEvent, self.onConnectorConnected)
+
+    def stopSupervising(self):
+        """Stop reconnecting, e.g. before stopping the connector on purpose."""
+        self.reconnectTimer.stop()
+        self.removeObservers()
+        self.connector = None
+        if self.inOutage:
+            self.endOutage()
+
+    def onConnectorDisconnected(self, caller=None, event=None):
+        if self.inOutage:
+            return
+        self.outageStartTime = time.monotonic()
+        self.outageStartWallTime = time.time()
+        self.backoff = self.INITIAL_BACKOFF_SEC
+        print("OpenIGTLink connection lost, reconnecting")
+        if self.onDisconnected:
+            self.onDisconnected()
+        self.scheduleReconnect()
+
+    def onConnectorConnected(self, caller=None, event=None):
+        if not self.inOutage:
+            return
+        self.reconnectTimer.stop()
+        duration = self.endOutage()
+        self.reconnectCount += 1
+        print(f"OpenIGTLink connection restored after {duration:.1f} s")
+        if self.onReconnected:
+            self.onReconnected()
+
+    def scheduleReconnect(self):
+        self.reconnectTimer.interval = int(self.backoff * 1000)
+        self.reconnectTimer.start()
+        self.backoff = min(self.backoff * 2, self.MAX_BACKOFF_SEC)
+
+    def attemptReconnect(self):
+        if not self.isSupervising or not self.inOutage:
+            return
+        if self.connector.GetState() == slicer.vtkMRMLIGTLConnectorNode.StateConnected:
+            self.onConnectorConnected()
+            return
+        print(f"Reconnection attempt, next in {self.backoff:.1f} s")
+        self.connector.Stop()
+        self.connector.Start()
+        self.scheduleReconnect()
+
+    def endOutage(self):
+        duration = time.monotonic() - self.outageStartTime
+        self.outages.append({"start": self.outageStartWallTime, "duration": duration})
+        self.outageStartTime = None
+        self.outageStartWallTime = None
+        return duration
+
+    def totalOutageTime(self):
+        total = sum(outage["duration"] for outage in self.outages)
+        if self.inOutage:
+            total += time.monotonic() - self.outageStartTime
+        return total
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+
+import numpy as np
+import slicer
+import vtk
+
+from slicer.util import VTKObservationMixin
+
+
+class LatencyMonitor(VTKObservationMixin):
+    """Measure the latency between a tracker pose arrival and its display.
+
+    The arrival of a pose is the ``TransformModifiedEvent`` of the transform node updated
+    by the OpenIGTLink connector, which is invoked as soon as the message is imported.
+    Latencies are then measured, relative to the latest arrival, for the following stages:
+
+    - ``propagation``: ``TransformModifiedEvent`` of a transform node observing the incoming one
+    - ``sliceJump``: modification of the last slice moved by :func:`OpenNavUtils.jumpAxisAlignedSlices`
+    - ``render``: end of the next render of any 3D or slice view
+
+    Each stage is recorded at most once per arrival. Samples are kept in fixed-size ring
+    buffers so that recording does not allocate.
+    """
+
+    STAGES = ("propagation", "sliceJump", "render")
+    PERCENTILES = (50, 90, 95, 99)
+    MAX_SAMPLES = 10000
+
+    # Jumps move Red, Yellow then Green, the Green slice modification ends the jump
+    SLICE_JUMP_NODE_ID = "vtkMRMLSliceNodeGreen"
+
+    def __init__(self):
+        super().__init__()
+        self.samples = {stage: np.zeros(self.MAX_SAMPLES) for stage in self.STAGES}
+        self.counts = dict.fromkeys(self.STAGES, 0)
+        self.arrivalCount = 0
+        self.arrivalTime = None
+        self.pendingStages = set()
+        self.isMonitoring = False
+
+    def reset(self):
+        self.counts = dict.fromkeys(self.STAGES, 0)
+        self.arrivalCount = 0
+        self.arrivalTime = None
+        self.pendingStages = set()
+
+    def start(self, arrivalNode, propagatedNode=None):
+        """Start measuring latencies of the poses received by ``arrivalNode``.
+
+        Observers are added with a high priority so that they run before the ones being measured.
+        """
+        self.stop()
+        self.reset()
+        self.isMonitoring = True
+        self.addObserver(arrivalNode, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onArrival, priority=1000.0)
+        if propagatedNode is not None:
+            self.addObserver(propagatedNode, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onPropagated, priority=1000.0)
+
+        sliceJumpNode = slicer.mrmlScene.GetNodeByID(self.SLICE_JUMP_NODE_ID)
+        if sliceJumpNode is not None:
+            self.addObserver(sliceJumpNode, vtk.vtkCommand.ModifiedEvent, self.onSliceJump)
+
+        layoutManager = slicer.app.layoutManager()
+        renderWindows = [layoutManager.sliceWidget(name).sliceView().renderWindow() for name in layoutManager.sliceViewNames()]
+        renderWindows += [layoutManager.threeDWidget(index).threeDView().renderWindow() for index in range(layoutManager.threeDViewCount)]
+        for renderWindow in renderWindows:
+            self.addObserver(renderWindow, vtk.vtkCommand.EndEvent, self.onRender)
+
+    def stop(self):
+        self.removeObservers()
+        self.isMonitoring = False
+
+    def onArrival(self, caller=None, event=None):
+        self.arrivalTime = time.perf_counter()
+        self.arrivalCount += 1
+        self.pendingStages.update(self.STAGES)
+
+    def mark(self, stage):
+        """Record the latency of ``stage`` for the latest pose, if not already recorded."""
+        if stage not in self.pendingStages:
+            return
+        self.pendingStages.discard(stage)
+        self.samples[stage][self.counts[stage] % self.MAX_SAMPLES] = time.perf_counter() - self.arrivalTime
+        self.counts[stage] += 1
+
+    def onPropagated(self, caller=None, event=None):
+        self.mark("propagation")
+
+    def onSliceJump(self, caller=None, event=None):
+        self.mark("sliceJump")
+
+    def onRender(self, caller=None, event=None):
+        self.mark("render")
+
+    def stageSamples(self, stage):
+        return self.samples[stage][: min(self.counts[stage], self.MAX_SAMPLES)]
+
+    def summary(self):
+        """Return latency percentiles in milliseconds, per stage, over the last :attr:`MAX_SAMPLES` poses."""
+        result = {"arrivals": self.arrivalCount}
+        for stage in self.STAGES:
+            samples = self.stageSamples(stage) * 1000.0
+            stageSummary = {"count": self.counts[stage]}
+            if len(samples):
+                stageSummary.update({f"p{percentile}": value for percentile, value in zip(self.PERCENTILES, np.percentile(samples, self.PERCENTILES).tolist(), strict=True)})
+                stageSummary["max"] = float(samples.max())
+            result[stage] = stageSummary
+        return result
+
+    def summaryText(self):
+        summary = self.summary()
+        lines = [f"Poses received: {summary['arrivals']}"]
+        for stage in self.STAGES:
+            stageSummary = summary[stage]
+            if stageSummary["count"] == 0:
+                lines.append(f"{stage}: no samples")
+                continue
+            percentiles = ", ".join(f"p{percentile} {stageSummary[f'p{percentile}']:.1f}" for percentile in self.PERCENTILES)
+            lines.append(f"{stage}: {percentiles}, max {stageSummary['max']:.1f} ms")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the summary and the raw samples (seconds) to a JSON file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "summary": self.summary(),
+            "samples": {stage: self.stageSamples(stage).tolist() for stage in self.STAGES},
+        }
+        with open(path, "w") as fh:
+            json.dump(data, fh)
+        print(f"Tracking latency written to {path}")
@@ -0,0 +1,112 @@
+import math
+import os
+import time
+
+import qt
+
+
+class Metric:
+    """A metric family in the OpenMetrics/Prometheus text format.
+
+    :param name: Metric name, e.g. ``opennav_tracker_connected``.
+    :param metricType: ``gauge``, ``counter``, ``summary`` or ``histogram``.
+    :param description: One-line description.
+    """
+
+    def __init__(self, name, metricType, description):
+        self.name = name
+        self.metricType = metricType
+        self.description = description
+        self.samples = []
+
+    def add(self, value, suffix="", **labels):
+        """Add a sample. ``suffix`` is appended to the name, e.g. ``_bucket`` for histograms."""
+        self.samples.append((suffix, labels, value))
+        return self
+
+    def text(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metricType}"]
+        for suffix, labels, value in self.samples:
+            labelText = ""
+            if labels:
+                labelText = "{" + ",".join(f'{key}="{_escapeLabel(labelValue)}"' for key, labelValue in labels.items()) + "}"
+            lines.append(f"{self.name}{suffix}{labelText} {_formatValue(value)}")
+        return "\n".join(lines)
+
+
+def _escapeLabel(value):
+    if isinstance(value, float):
+        return _formatValue(value)
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatValue(value):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(value)
+
+
+class MetricsExporter:
+    """Periodically write metrics to a file, for the node-exporter textfile collector.
+
+    Metrics are gathered from collectors, callables returning a list of :class:`Metric`
+    built from counters the application already keeps, so that exporting adds nothing to
+    the tracking path. The file is written to a temporary file then renamed, so a scrape
+    never reads a partial file.
+    """
+
+    DEFAULT_INTERVAL_SEC = 15.0
+
+    def __init__(self):
+        self.path = None
+        self.collectors = []
+        self.timer = qt.QTimer()
+        self.timer.timeout.connect(self.export)
+
+    @property
+    def isExporting(self):
+        return self.timer.isActive()
+
+    def addCollector(self, collector):
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def removeCollector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def start(self, path, interval=DEFAULT_INTERVAL_SEC):
+        self.path = path
+        self.timer.interval = int(interval * 1000)
+        self.timer.start()
+        self.export()
+
+    def stop(self):
+        self.timer.stop()
+
+    def text(self):
+        metrics = []
+        for collector in self.collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                # A failing collector must not prevent exporting the others
+                print(f"Metrics collection failed: {e}")
+        metrics.append(Metric("opennav_metrics_export_timestamp_seconds", "gauge", "Time of the last metrics export.").add(time.time()))
+        return "\n".join(metric.text() for metric in metrics) + "\n"
+
+    def export(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", "w") as fh:
+                fh.write(self.text())
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"Metrics export to {self.path} failed: {e}")
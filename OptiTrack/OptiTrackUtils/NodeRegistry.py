@@ -0,0 +1,55 @@
+import slicer
+import vtk
+
+from slicer.util import VTKObservationMixin
+
+
+class NodeRegistry(VTKObservationMixin):
+    """Keep handles to tracked nodes by name, without searching the scene on each lookup.
+
+    A name is resolved in the scene the first time it is looked up, then the handle is kept
+    up to date from the scene ``NodeAddedEvent`` and ``NodeAboutToBeRemovedEvent``. Each node
+    is set up (:func:`prepare`) only once, until it is removed from the scene.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.nodes = {}
+        self.preparedNodeIDs = set()
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.NodeAboutToBeRemovedEvent, self.onNodeAboutToBeRemoved)
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.EndCloseEvent, self.onSceneEndClose)
+
+    def node(self, name):
+        """Return the node named ``name``, or None if there is none in the scene."""
+        if name not in self.nodes:
+            self.nodes[name] = slicer.mrmlScene.GetFirstNodeByName(name)
+        return self.nodes[name]
+
+    def prepare(self, node):
+        """Create the default display nodes of ``node`` and exclude it from saved scenes, once."""
+        if node.GetID() in self.preparedNodeIDs:
+            return
+        node.CreateDefaultDisplayNodes()
+        node.SaveWithSceneOff()
+        self.preparedNodeIDs.add(node.GetID())
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, caller, event, calldata):
+        node = calldata
+        name = node.GetName()
+        if name in self.nodes and self.nodes[name] is None:
+            self.nodes[name] = node
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAboutToBeRemoved(self, caller, event, calldata):
+        node = calldata
+        self.preparedNodeIDs.discard(node.GetID())
+        name = node.GetName()
+        if self.nodes.get(name) is node:
+            # Resolve again on next lookup, another node may have the same name
+            del self.nodes[name]
+
+    def onSceneEndClose(self, caller=None, event=None):
+        self.nodes = {}
+        self.preparedNodeIDs = set()
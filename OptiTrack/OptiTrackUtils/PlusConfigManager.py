@@ -0,0 +1,127 @@
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+
+class PlusConfigError(ValueError):
+    """Raised when a PlusServer configuration template cannot be rendered or is invalid."""
+
+
+class PlusConfigManager:
+    """Render PlusServer configuration files from templates, with validation and caching.
+
+    Templates are XML files where ``{0}`` is replaced by a data file path (e.g. a Motive
+    profile or a sequence file). Each template is parsed and validated once, then rendered
+    configurations are written to ``cacheDirectory`` and reused as long as neither the
+    template nor the data file change, including across PlusServer restarts.
+
+    Validation checks that:
+
+    - the template is well-formed XML with a ``DataCollection`` holding a ``DeviceSet`` and devices with unique ids
+    - the ``PlusOpenIGTLinkServer`` output channel is provided by a device
+    - each sent transform name is ``<From>To<To>`` with known tools or reference frames
+    - the expected transform nodes are all sent
+    """
+
+    def __init__(self, cacheDirectory):
+        self.cacheDirectory = cacheDirectory
+        # Validated templates, keyed by path, with the file signature they were validated for
+        self.templates = {}
+        self.renderedPaths = {}
+
+    @staticmethod
+    def fileSignature(path):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise PlusConfigError(f"Cannot read {path}: {e.strerror}") from e
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def loadTemplate(self, templatePath):
+        """Return the template text and the transform names it sends, parsing and validating it if needed."""
+        signature = self.fileSignature(templatePath)
+        cached = self.templates.get(templatePath)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+
+        with open(templatePath) as fh:
+            template = fh.read()
+        try:
+            root = ET.fromstring(template)
+        except ET.ParseError as e:
+            raise PlusConfigError(f"{os.path.basename(templatePath)} is not valid XML: {e}") from e
+        transformNames = self.validate(root, os.path.basename(templatePath))
+
+        self.templates[templatePath] = (signature, template, transformNames)
+        return template, transformNames
+
+    @staticmethod
+    def validate(root, name):
+        """Check the device set of a parsed configuration and return the transform names sent by the server."""
+        if root.tag != "PlusConfiguration":
+            raise PlusConfigError(f"{name}: root element is {root.tag}, expected PlusConfiguration")
+        dataCollection = root.find("DataCollection")
+        if dataCollection is None or dataCollection.find("DeviceSet") is None:
+            raise PlusConfigError(f"{name}: missing DataCollection/DeviceSet")
+
+        devices = dataCollection.findall("Device")
+        if not devices:
+            raise PlusConfigError(f"{name}: no Device in DataCollection")
+        deviceIds = [device.get("Id") for device in devices]
+        duplicates = {deviceId for deviceId in deviceIds if deviceIds.count(deviceId) > 1}
+        if None in deviceIds or duplicates:
+            raise PlusConfigError(f"{name}: devices must have unique ids, got {deviceIds}")
+
+        frames = set()
+        outputChannels = set()
+        for device in devices:
+            if device.get("ToolReferenceFrame"):
+                frames.add(device.get("ToolReferenceFrame"))
+            frames.update(source.get("Id") for source in device.iterfind("DataSources/DataSource") if source.get("Type") == "Tool")
+            outputChannels.update(channel.get("Id") for channel in device.iterfind("OutputChannels/OutputChannel"))
+
+        server = root.find("PlusOpenIGTLinkServer")
+        if server is None:
+            raise PlusConfigError(f"{name}: missing PlusOpenIGTLinkServer")
+        if server.get("OutputChannelId") not in outputChannels:
+            raise PlusConfigError(f"{name}: server output channel {server.get('OutputChannelId')} is not provided by any device")
+
+        transformNames = [transform.get("Name") for transform in server.iterfind("DefaultClientInfo/TransformNames/Transform")]
+        for transformName in transformNames:
+            parts = transformName.split("To")
+            # Frame names may contain "To" themselves, accept any split into two known frames
+            if not any("To".join(parts[:i]) in frames and "To".join(parts[i:]) in frames for i in range(1, len(parts))):
+                raise PlusConfigError(f"{name}: transform {transformName} does not relate two known frames ({', '.join(sorted(frames))})")
+        return transformNames
+
+    def render(self, templatePath, dataPath, expectedNodes=None):
+        """Return the path of the configuration rendered from ``templatePath`` with ``dataPath``.
+
+        Raise :class:`PlusConfigError` if the template is invalid, the data file is missing
+        or one of ``expectedNodes`` is not sent by the server.
+        """
+        template, transformNames = self.loadTemplate(templatePath)
+        missingNodes = [nodeName for nodeName in expectedNodes or [] if nodeName not in transformNames]
+        if missingNodes:
+            raise PlusConfigError(f"{os.path.basename(templatePath)} does not send {', '.join(missingNodes)}")
+
+        key = (self.fileSignature(templatePath), self.fileSignature(dataPath))
+        configPath = self.renderedPaths.get(key)
+        if configPath is not None and os.path.exists(configPath):
+            return configPath
+
+        # The file name depends on the signatures only, so previous sessions' renders are reused too
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        configPath = os.path.join(self.cacheDirectory, f"{os.path.basename(templatePath).split('.')[0]}-{digest}.xml")
+        if not os.path.exists(configPath):
+            try:
+                configData = template.format(escape(dataPath, {'"': "&quot;"}))
+            except (IndexError, KeyError, ValueError) as e:
+                raise PlusConfigError(f"{os.path.basename(templatePath)} cannot be formatted: {e!r}") from e
+            os.makedirs(self.cacheDirectory, exist_ok=True)
+            with open(configPath + ".tmp", "w") as fh:
+                fh.write(configData)
+            os.replace(configPath + ".tmp", configPath)
+        self.renderedPaths[key] = configPath
+        return configPath
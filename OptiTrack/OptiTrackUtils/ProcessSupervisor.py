@@ -0,0 +1,198 @@
+import collections
+import ctypes
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+
+import qt
+
+
+def _windowsProcessUsage(pid):
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    PROCESS_VM_READ = 0x0010
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ, False, pid)
+    if not handle:
+        return None
+    try:
+        creationTime, exitTime, kernelTime, userTime = (wintypes.FILETIME() for _ in range(4))
+        if not kernel32.GetProcessTimes(handle, ctypes.byref(creationTime), ctypes.byref(exitTime), ctypes.byref(kernelTime), ctypes.byref(userTime)):
+            return None
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        # FILETIME is in 100 ns units
+        cpuTime = sum((filetime.dwHighDateTime << 32 | filetime.dwLowDateTime) for filetime in (kernelTime, userTime)) * 1e-7
+        return cpuTime, counters.WorkingSetSize
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _procfsProcessUsage(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as fh:
+            # Fields after the command name, which may contain spaces
+            fields = fh.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as fh:
+            residentPages = int(fh.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpuTime = (int(fields[11]) + int(fields[12])) / ticks
+    return cpuTime, residentPages * os.sysconf("SC_PAGE_SIZE")
+
+
+def processUsage(pid):
+    """Return the CPU time (s) and resident memory (bytes) of a process, or None if unavailable."""
+    if sys.platform == "win32":
+        return _windowsProcessUsage(pid)
+    if os.path.exists("/proc"):
+        return _procfsProcessUsage(pid)
+    return None
+
+
+class ProcessSupervisor:
+    """Drain the output of a server process and monitor it while it runs.
+
+    The output (stdout, merged with stderr by :func:`slicer.util.launchConsoleProcess`) is read
+    on a background thread so that the pipe never fills up and blocks the process. Lines are
+    kept in a ring buffer of :attr:`OUTPUT_BUFFER_LINES` and written to a rotating log file.
+
+    On the main thread, the process is polled every :attr:`SAMPLE_INTERVAL_MS` to detect its
+    exit and to sample its CPU usage (percent of one core) and resident memory.
+    """
+
+    OUTPUT_BUFFER_LINES = 2000
+    LOG_MAX_BYTES = 5 * 1024 * 1024
+    LOG_BACKUP_COUNT = 3
+    SAMPLE_INTERVAL_MS = 1000
+    MAX_USAGE_SAMPLES = 3600
+
+    def __init__(self, name="PlusServer", onExited=None):
+        self.name = name
+        self.onExited = onExited
+        self.process = None
+        self.startTime = None
+        self.returnCode = None
+        self.outputLines = collections.deque(maxlen=self.OUTPUT_BUFFER_LINES)
+        self.outputLock = threading.Lock()
+        self.readerThread = None
+        self.logger = logging.getLogger(f"OpenNav.{name}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logHandler = None
+        # (seconds since start, CPU percent, resident memory in bytes)
+        self.usageSamples = collections.deque(maxlen=self.MAX_USAGE_SAMPLES)
+        self.lastCpuTime = None
+        self.lastSampleTime = None
+
+        self.timer = qt.QTimer()
+        self.timer.interval = self.SAMPLE_INTERVAL_MS
+        self.timer.timeout.connect(self.poll)
+
+    @property
+    def isRunning(self):
+        return self.process is not None and self.returnCode is None
+
+    @property
+    def uptime(self):
+        if self.startTime is None or not self.isRunning:
+            return 0.0
+        return time.monotonic() - self.startTime
+
+    def start(self, process, logPath=None):
+        self.stop()
+        self.process = process
+        self.startTime = time.monotonic()
+        self.returnCode = None
+        self.usageSamples.clear()
+        self.lastCpuTime = None
+        with self.outputLock:
+            self.outputLines.clear()
+
+        if logPath is not None:
+            os.makedirs(os.path.dirname(logPath), exist_ok=True)
+            self.logHandler = logging.handlers.RotatingFileHandler(logPath, maxBytes=self.LOG_MAX_BYTES, backupCount=self.LOG_BACKUP_COUNT)
+            self.logHandler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(self.logHandler)
+
+        if process.stdout is not None:
+            self.readerThread = threading.Thread(target=self.readOutput, args=(process.stdout,), name=f"{self.name}Output", daemon=True)
+            self.readerThread.start()
+        self.timer.start()
+
+    def stop(self):
+        """Stop monitoring. The process must have been terminated for the output thread to finish."""
+        self.timer.stop()
+        if self.readerThread is not None:
+            self.readerThread.join(timeout=2.0)
+            self.readerThread = None
+        if self.logHandler is not None:
+            self.logger.removeHandler(self.logHandler)
+            self.logHandler.close()
+            self.logHandler = None
+        if self.process is not None and self.returnCode is None:
+            self.returnCode = self.process.poll()
+
+    def readOutput(self, stream):
+        for line in iter(stream.readline, ""):
+            line = line.rstrip()
+            with self.outputLock:
+                self.outputLines.append(line)
+            self.logger.info(line)
+
+    def outputText(self, lineCount=None):
+        """Return the last ``lineCount`` output lines (all buffered lines by default)."""
+        with self.outputLock:
+            lines = list(self.outputLines)
+        if lineCount is not None:
+            lines = lines[-lineCount:]
+        return "\n".join(lines)
+
+    def poll(self):
+        returnCode = self.process.poll()
+        if returnCode is not None:
+            self.timer.stop()
+            self.returnCode = returnCode
+            if self.onExited:
+                self.onExited(returnCode)
+            return
+        self.sampleUsage()
+
+    def sampleUsage(self):
+        usage = processUsage(self.process.pid)
+        if usage is None:
+            return
+        cpuTime, memory = usage
+        now = time.monotonic()
+        if self.lastCpuTime is not None and now > self.lastSampleTime:
+            cpuPercent = 100.0 * (cpuTime - self.lastCpuTime) / (now - self.lastSampleTime)
+            self.usageSamples.append((now - self.startTime, cpuPercent, memory))
+        self.lastCpuTime = cpuTime
+        self.lastSampleTime = now
+
+    def latestUsage(self):
+        """Return the latest ``(CPU percent, resident memory in bytes)`` sample, or None."""
+        if not self.usageSamples:
+            return None
+        return self.usageSamples[-1][1:]
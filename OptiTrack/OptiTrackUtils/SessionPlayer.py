@@ -0,0 +1,132 @@
+import time
+
+import numpy as np
+import qt
+import slicer
+import vtk
+
+from .SessionRecorder import readTrackingSession
+
+
+class SessionPlayer:
+    """Replay a recorded tracking session directly into MRML transform nodes.
+
+    Recorded transforms are applied in order to transform nodes with the recorded
+    tool names, exactly as the OpenIGTLink connector would, so that every observer
+    (tool status, tracing, slice jumping) runs as during the recorded case.
+
+    Playback is driven by a timer, either at a speed relative to the recording
+    (1.0 is real-time) or as fast as possible (``speed=None``), in which case
+    :attr:`FAST_CHUNK_SIZE` transforms are applied per event loop iteration to
+    keep the application responsive.
+    """
+
+    TIMER_INTERVAL_MS = 5
+    FAST_CHUNK_SIZE = 500
+
+    def __init__(self, onFinished=None):
+        self.onFinished = onFinished
+        self.toolNames = []
+        self.records = None
+        self.timestamps = None
+        self.nodes = []
+        self.matrix = vtk.vtkMatrix4x4()
+        self.position = 0
+        self.speed = 1.0
+        self.playStartTime = None
+        self.playStartSessionTime = None
+
+        self.timer = qt.QTimer()
+        self.timer.timeout.connect(self.onTimeout)
+
+    @property
+    def isPlaying(self):
+        return self.timer.isActive()
+
+    @property
+    def duration(self):
+        if self.timestamps is None or len(self.timestamps) == 0:
+            return 0.0
+        return float(self.timestamps[-1] - self.timestamps[0])
+
+    @property
+    def currentTime(self):
+        """Session time of the next transform to apply, in seconds from the start of the recording."""
+        if self.timestamps is None or len(self.timestamps) == 0:
+            return 0.0
+        index = min(self.position, len(self.timestamps) - 1)
+        return float(self.timestamps[index] - self.timestamps[0])
+
+    def load(self, path, nodeNames=None):
+        """Load a session file. If ``nodeNames`` is given, only these tools are replayed."""
+        self.stop()
+        self.toolNames, self.records = readTrackingSession(path)
+        if nodeNames is not None:
+            toolIds = [toolId for toolId, name in enumerate(self.toolNames) if name in nodeNames]
+            self.records = self.records[np.isin(self.records["toolId"], toolIds)]
+        self.timestamps = np.asarray(self.records["timestamp"])
+        replayedToolIds = set(np.unique(self.records["toolId"]).tolist())
+        self.nodes = [self.getOrCreateNode(name) if toolId in replayedToolIds else None for toolId, name in enumerate(self.toolNames)]
+        self.position = 0
+        print(f"Tracking session loaded: {len(self.records)} transforms, {self.duration:.1f} s")
+
+    def getOrCreateNode(self, name):
+        node = slicer.mrmlScene.GetFirstNodeByName(name)
+        if node is None:
+            node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLinearTransformNode", name)
+            node.SaveWithSceneOff()
+        return node
+
+    def play(self, speed=1.0):
+        """Start or resume playback. ``speed=None`` replays as fast as possible."""
+        if self.records is None:
+            return
+        if self.position >= len(self.records):
+            self.position = 0
+        self.speed = speed
+        self.playStartTime = time.monotonic()
+        self.playStartSessionTime = self.currentTime
+        self.timer.interval = 0 if speed is None else self.TIMER_INTERVAL_MS
+        self.timer.start()
+
+    def pause(self):
+        self.timer.stop()
+
+    def stop(self):
+        self.timer.stop()
+        self.position = 0
+
+    def seek(self, sessionTime):
+        """Move to ``sessionTime`` seconds from the start, applying the last pose of each tool before it."""
+        if self.records is None or len(self.records) == 0:
+            return
+        self.position = int(np.searchsorted(self.timestamps, self.timestamps[0] + sessionTime))
+        toolIds = self.records["toolId"][: self.position]
+        for toolId in range(len(self.toolNames)):
+            indexes = np.flatnonzero(toolIds == toolId)
+            if len(indexes):
+                self.apply(indexes[-1])
+        if self.isPlaying:
+            self.play(self.speed)
+
+    def apply(self, index):
+        record = self.records[index]
+        self.matrix.DeepCopy(record["matrix"].ravel().tolist())
+        self.nodes[record["toolId"]].SetMatrixTransformToParent(self.matrix)
+
+    def onTimeout(self):
+        if self.speed is None:
+            end = min(self.position + self.FAST_CHUNK_SIZE, len(self.records))
+        else:
+            sessionTime = self.playStartSessionTime + (time.monotonic() - self.playStartTime) * self.speed
+            end = int(np.searchsorted(self.timestamps, self.timestamps[0] + sessionTime, side="right"))
+
+        for index in range(self.position, end):
+            self.apply(index)
+        self.position = end
+
+        if self.position >= len(self.records):
+            self.timer.stop()
+            print("Tracking session replay finished")
+            if self.onFinished:
+                self.onFinished()
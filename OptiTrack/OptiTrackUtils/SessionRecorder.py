@@ -0,0 +1,146 @@
+import json
+import os
+import time
+
+import numpy as np
+import slicer
+import vtk
+
+from slicer.util import VTKObservationMixin
+
+# Tracking session file layout:
+#   - a fixed-size header: magic, then the JSON metadata (tool names) padded with spaces
+#   - fixed-size little-endian records, appended as transforms arrive
+TRACKING_SESSION_MAGIC = b"OPENNAVTRK\x00\x01"
+TRACKING_SESSION_HEADER_SIZE = 4096
+TRACKING_SESSION_RECORD_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),  # seconds since epoch
+        ("toolId", "<u4"),  # index in the header tool names
+        ("matrix", "<f4", (4, 4)),  # row-major tool to parent transform
+    ],
+)
+
+
+def _writeTrackingSessionHeader(fh, toolNames):
+    metadata = json.dumps({"version": 1, "tools": toolNames}).encode("utf-8")
+    header = TRACKING_SESSION_MAGIC + metadata
+    if len(header) > TRACKING_SESSION_HEADER_SIZE:
+        raise ValueError("Too many tools to record in a tracking session")
+    fh.seek(0)
+    fh.write(header.ljust(TRACKING_SESSION_HEADER_SIZE, b" "))
+
+
+def readTrackingSession(path):
+    """Memory-map a tracking session file.
+
+    Return the tool names and a read-only structured array with ``timestamp``,
+    ``toolId`` and ``matrix`` fields, one element per recorded transform.
+
+    >>> toolNames, records = readTrackingSession(path)
+    >>> pointer = records[records["toolId"] == toolNames.index("PointerToTracker")]
+    >>> positions = pointer["matrix"][:, :3, 3]
+    """
+    with open(path, "rb") as fh:
+        header = fh.read(TRACKING_SESSION_HEADER_SIZE)
+    if not header.startswith(TRACKING_SESSION_MAGIC):
+        raise ValueError(f"{path} is not a tracking session file")
+    metadata = json.loads(header[len(TRACKING_SESSION_MAGIC) :].decode("utf-8"))
+
+    recordCount = (os.path.getsize(path) - TRACKING_SESSION_HEADER_SIZE) // TRACKING_SESSION_RECORD_DTYPE.itemsize
+    if recordCount == 0:
+        return metadata["tools"], np.zeros(0, dtype=TRACKING_SESSION_RECORD_DTYPE)
+    records = np.memmap(path, dtype=TRACKING_SESSION_RECORD_DTYPE, mode="r", offset=TRACKING_SESSION_HEADER_SIZE, shape=(recordCount,))
+    return metadata["tools"], records
+
+
+class SessionRecorder(VTKObservationMixin):
+    """Record every update of tracked transform nodes to a tracking session file.
+
+    Transforms are copied in a preallocated record buffer, written to disk once
+    :attr:`BUFFER_SIZE` records are collected and on :func:`flush`/:func:`stop`.
+    See :func:`readTrackingSession` to load a recording.
+    """
+
+    BUFFER_SIZE = 1024
+
+    def __init__(self):
+        super().__init__()
+        self.path = None
+        self.file = None
+        self.toolNames = []
+        self.nodeToolIds = {}
+        self.recordCount = 0
+        self.buffer = np.zeros(self.BUFFER_SIZE, dtype=TRACKING_SESSION_RECORD_DTYPE)
+        self.bufferMatrices = self.buffer["matrix"].reshape(self.BUFFER_SIZE, 16)
+        self.bufferLength = 0
+        self.matrix = vtk.vtkMatrix4x4()
+        self.elements = [0.0] * 16
+
+    @property
+    def isRecording(self):
+        return self.file is not None
+
+    def start(self, path, nodeNames):
+        """Start recording the transform nodes named ``nodeNames`` into a new file at ``path``.
+
+        Nodes that are not in the scene yet are recorded as soon as they are added.
+        """
+        self.stop()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = open(path, "wb")
+        self.toolNames = list(nodeNames)
+        self.recordCount = 0
+        self.bufferLength = 0
+        _writeTrackingSessionHeader(self.file, self.toolNames)
+
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+        for name in self.toolNames:
+            node = slicer.mrmlScene.GetFirstNodeByName(name)
+            if node is not None:
+                self.observeNode(node)
+
+    def stop(self):
+        if not self.isRecording:
+            return
+        self.removeObservers()
+        self.nodeToolIds = {}
+        self.flush()
+        self.file.close()
+        self.file = None
+        print(f"Tracking session recorded: {self.recordCount} transforms in {self.path}")
+
+    def observeNode(self, node):
+        if node in self.nodeToolIds:
+            return
+        self.nodeToolIds[node] = self.toolNames.index(node.GetName())
+        self.addObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onTransformModified)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, caller, event, calldata):
+        node = calldata
+        if isinstance(node, slicer.vtkMRMLTransformNode) and node.GetName() in self.toolNames:
+            self.observeNode(node)
+
+    def onTransformModified(self, caller, event):
+        self.record(self.nodeToolIds[caller], caller)
+
+    def record(self, toolId, node, timestamp=None):
+        node.GetMatrixTransformToParent(self.matrix)
+        vtk.vtkMatrix4x4.DeepCopy(self.elements, self.matrix)
+        index = self.bufferLength
+        self.buffer["timestamp"][index] = time.time() if timestamp is None else timestamp
+        self.buffer["toolId"][index] = toolId
+        self.bufferMatrices[index] = self.elements
+        self.bufferLength += 1
+        if self.bufferLength == self.BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.isRecording or self.bufferLength == 0:
+            return
+        self.file.write(self.buffer[: self.bufferLength].tobytes())
+        self.file.flush()
+        self.recordCount += self.bufferLength
+        self.bufferLength = 0
@@ -0,0 +1,282 @@
+import math
+import os
+import time
+
+import numpy as np
+import qt
+import slicer
+import vtk
+
+from slicer.util import VTKObservationMixin
+
+from .ConnectionManager import ConnectionManager
+from .ProcessSupervisor import ProcessSupervisor
+
+
+class TrackerSource(VTKObservationMixin):
+    """An additional OpenIGTLink tracker connection, e.g. an EM tracker next to the OptiTrack.
+
+    Each source has its own connector and its own device name namespace: the server sends
+    its transforms prefixed with :attr:`deviceNamePrefix`, e.g. ``EM_SensorToTracker``. A
+    connector writes into any scene node named like an incoming device, so without a prefix
+    two trackers sending the same device names, or a source sending a PlusServer name, would
+    overwrite each other's nodes. Nodes are looked up by their prefixed name among the
+    incoming nodes of the connector only, and tagged with the ``OpenNav.TrackerSource`` attribute.
+
+    :param name: Namespace of the source, e.g. ``"EM"``.
+    :param port: OpenIGTLink server port.
+    :param expectedNodes: Names of the transforms sent by the server, without the prefix.
+    :param timeOffset: Latency of the source in seconds, subtracted from arrival times for fusion.
+    :param command: Optional command launching the server, supervised like PlusServer.
+    :param deviceNamePrefix: Prefix of the device names sent by the server, ``"{name}_"`` by default.
+    """
+
+    def __init__(self, name, port, expectedNodes, host="localhost", timeOffset=0.0, command=None, deviceNamePrefix=None):
+        super().__init__()
+        self.name = name
+        self.deviceNamePrefix = f"{name}_" if deviceNamePrefix is None else deviceNamePrefix
+        self.host = host
+        self.port = port
+        self.expectedNodes = list(expectedNodes)
+        self.timeOffset = timeOffset
+        self.command = command
+        self.connector = None
+        self.process = None
+        self.connectionManager = ConnectionManager()
+        self.processSupervisor = ProcessSupervisor(f"TrackerSource{name}")
+
+    @property
+    def isConnected(self):
+        return self.connector is not None and self.connector.GetState() == slicer.vtkMRMLIGTLConnectorNode.StateConnected
+
+    def start(self, logDirectory=None):
+        if self.command:
+            self.process = slicer.util.launchConsoleProcess(self.command)
+            self.processSupervisor.start(self.process, None if logDirectory is None else os.path.join(logDirectory, f"{self.name}.log"))
+        if self.connector is None:
+            self.connector = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLIGTLConnectorNode", f"{self.name}Connector")
+            self.connector.SaveWithSceneOff()
+            self.connector.SetTypeClient(self.host, self.port)
+            self.addObserver(self.connector, slicer.vtkMRMLIGTLConnectorNode.NewDeviceEvent, self.onNewDevice)
+        self.connector.Start()
+        self.connectionManager.startSupervising(self.connector)
+
+    def stop(self):
+        self.connectionManager.stopSupervising()
+        if self.connector is not None:
+            self.connector.Stop()
+        if self.process is not None:
+            self.process.terminate()
+            self.processSupervisor.stop()
+            self.process = None
+
+    def cleanup(self):
+        self.stop()
+        self.removeObservers()
+        if self.connector is not None:
+            for index in reversed(range(self.connector.GetNumberOfIncomingMRMLNodes())):
+                slicer.mrmlScene.RemoveNode(self.connector.GetIncomingMRMLNode(index))
+            slicer.mrmlScene.RemoveNode(self.connector)
+            self.connector = None
+
+    def deviceName(self, nodeName):
+        """Return the name of the device, and of its node in the scene, sent by this source for ``nodeName``."""
+        return self.deviceNamePrefix + nodeName
+
+    def onNewDevice(self, caller=None, event=None):
+        for index in range(self.connector.GetNumberOfIncomingMRMLNodes()):
+            node = self.connector.GetIncomingMRMLNode(index)
+            if node.GetAttribute("OpenNav.TrackerSource") is not None:
+                continue
+            node.SetAttribute("OpenNav.TrackerSource", self.name)
+            node.SaveWithSceneOff()
+            if not node.GetName().startswith(self.deviceNamePrefix):
+                print(f"Tracker source {self.name}: device {node.GetName()} is not prefixed with {self.deviceNamePrefix}, it may overwrite nodes of other trackers")
+
+    def node(self, nodeName):
+        """Return the node received by this source for ``nodeName``, or None if not received yet."""
+        if self.connector is None:
+            return None
+        deviceName = self.deviceName(nodeName)
+        for index in range(self.connector.GetNumberOfIncomingMRMLNodes()):
+            node = self.connector.GetIncomingMRMLNode(index)
+            if node.GetName() == deviceName:
+                return node
+        return None
+
+
+class PoseHistory:
+    """Fixed-size ring buffer of timestamped poses (translation and unit quaternion)."""
+
+    def __init__(self, size):
+        self.times = np.full(size, -np.inf)
+        self.positions = np.zeros((size, 3))
+        self.quaternions = np.zeros((size, 4))
+        self.count = 0
+        self.rotation = [[0.0] * 3 for _ in range(3)]
+        self.quaternion = [1.0, 0.0, 0.0, 0.0]
+
+    @property
+    def newestTime(self):
+        """Timestamp of the newest sample, or None if there is none."""
+        if self.count == 0:
+            return None
+        return self.times[(self.count - 1) % len(self.times)]
+
+    def add(self, timestamp, matrix):
+        index = self.count % len(self.times)
+        for row in range(3):
+            for column in range(3):
+                self.rotation[row][column] = matrix.GetElement(row, column)
+            self.positions[index, row] = matrix.GetElement(row, 3)
+        vtk.vtkMath.Matrix3x3ToQuaternion(self.rotation, self.quaternion)
+        self.quaternions[index] = self.quaternion
+        self.times[index] = timestamp
+        self.count += 1
+
+    def sample(self, timestamp, matrix):
+        """Interpolate the pose at ``timestamp`` into ``matrix``. Return False if there is no sample yet.
+
+        Before the first or after the last sample, the nearest pose is used.
+        """
+        if self.count == 0:
+            return False
+        size = min(self.count, len(self.times))
+        # Indexes of the buffered samples, oldest first
+        order = (np.arange(size) + self.count - size) % len(self.times)
+        times = self.times[order]
+        after = int(np.searchsorted(times, timestamp))
+        if after == 0:
+            position, quaternion = self.positions[order[0]], self.quaternions[order[0]]
+        elif after == size:
+            position, quaternion = self.positions[order[-1]], self.quaternions[order[-1]]
+        else:
+            i0, i1 = order[after - 1], order[after]
+            weight = (timestamp - self.times[i0]) / (self.times[i1] - self.times[i0])
+            position = self.positions[i0] + weight * (self.positions[i1] - self.positions[i0])
+            quaternion = slerp(self.quaternions[i0], self.quaternions[i1], weight)
+
+        vtk.vtkMath.QuaternionToMatrix3x3(quaternion.tolist(), self.rotation)
+        for row in range(3):
+            for column in range(3):
+                matrix.SetElement(row, column, self.rotation[row][column])
+            matrix.SetElement(row, 3, position[row])
+        return True
+
+
+def slerp(q0, q1, weight):
+    """Spherical linear interpolation between two unit quaternions."""
+    dot = float(np.dot(q0, q1))
+    if dot < 0.0:
+        q1 = -q1
+        dot = -dot
+    if dot > 0.9995:
+        result = q0 + weight * (q1 - q0)
+        return result / np.linalg.norm(result)
+    theta = np.arccos(dot)
+    return (np.sin((1.0 - weight) * theta) * q0 + np.sin(weight * theta) * q1) / np.sin(theta)
+
+
+class TrackerFusion(VTKObservationMixin):
+    """Time-align poses from several tracker sources on a common clock.
+
+    Every update of an input node is timestamped on arrival, minus the latency of its
+    source, and kept in a :class:`PoseHistory`. At :attr:`rate` Hz, each output node is set
+    to its input pose interpolated at ``now - delay``: the delay should cover the latency
+    difference between sources, so that poses of all sources are interpolated rather than
+    extrapolated and describe the same instant.
+
+    An output node is only modified when its pose changes. An input without a sample for
+    :attr:`staleTimeout` seconds stops driving its output, so the fused tool drops out like
+    the input does.
+    """
+
+    HISTORY_SIZE = 256
+    DEFAULT_RATE = 60.0
+    DEFAULT_DELAY_SEC = 0.05
+    # Same as the tool status stale timeout, see RegistrationUtils.Tools
+    DEFAULT_STALE_TIMEOUT_SEC = 0.25
+
+    def __init__(self):
+        super().__init__()
+        self.rate = self.DEFAULT_RATE
+        self.delay = self.DEFAULT_DELAY_SEC
+        self.staleTimeout = self.DEFAULT_STALE_TIMEOUT_SEC
+        # Output node name -> input node lookup, input node, source time offset, history, output node
+        # and last matrix elements written to the output node
+        self.inputs = {}
+        # Input node -> names of the output nodes it feeds
+        self.nodeOutputs = {}
+        self.matrix = vtk.vtkMatrix4x4()
+        self.elements = [0.0] * 16
+
+        self.timer = qt.QTimer()
+        self.timer.timeout.connect(self.update)
+
+    def addInput(self, outputName, getNode, timeOffset=0.0):
+        """Fuse the node returned by ``getNode()`` into a new node named ``outputName``.
+
+        ``getNode`` is called until it returns a node, so inputs may be added before the
+        tracker sends anything.
+        """
+        self.removeInput(outputName)
+        outputNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLinearTransformNode", outputName)
+        outputNode.SaveWithSceneOff()
+        self.inputs[outputName] = {"getNode": getNode, "node": None, "timeOffset": timeOffset, "history": PoseHistory(self.HISTORY_SIZE), "output": outputNode, "elements": [math.nan] * 16}
+        return outputNode
+
+    def removeInput(self, outputName):
+        fusedInput = self.inputs.pop(outputName, None)
+        if fusedInput is None:
+            return
+        if fusedInput["node"] is not None:
+            self.removeObserver(fusedInput["node"], slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onInputModified)
+            self.nodeOutputs[fusedInput["node"]].remove(outputName)
+        slicer.mrmlScene.RemoveNode(fusedInput["output"])
+
+    def start(self):
+        self.timer.interval = int(1000.0 / self.rate)
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def clear(self):
+        self.stop()
+        for outputName in list(self.inputs):
+            self.removeInput(outputName)
+
+    def resolveInputs(self):
+        for outputName, fusedInput in self.inputs.items():
+            if fusedInput["node"] is not None:
+                continue
+            node = fusedInput["getNode"]()
+            if node is None:
+                continue
+            fusedInput["node"] = node
+            if node not in self.nodeOutputs:
+                self.nodeOutputs[node] = []
+                self.addObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onInputModified)
+            self.nodeOutputs[node].append(outputName)
+
+    def onInputModified(self, caller, event=None):
+        now = time.perf_counter()
+        caller.GetMatrixTransformToParent(self.matrix)
+        for outputName in self.nodeOutputs[caller]:
+            fusedInput = self.inputs[outputName]
+            fusedInput["history"].add(now - fusedInput["timeOffset"], self.matrix)
+
+    def update(self):
+        self.resolveInputs()
+        now = time.perf_counter()
+        for fusedInput in self.inputs.values():
+            history = fusedInput["history"]
+            newestTime = history.newestTime
+            if newestTime is None or now - fusedInput["timeOffset"] - newestTime > self.staleTimeout:
+                continue
+            history.sample(now - self.delay, self.matrix)
+            vtk.vtkMatrix4x4.DeepCopy(self.elements, self.matrix)
+            if self.elements == fusedInput["elements"]:
+                continue
+            fusedInput["elements"][:] = self.elements
+            fusedInput["output"].SetMatrixTransformToParent(self.matrix)
@@ -0,0 +1,311 @@
+"""Local OpenIGTLink tracker simulator.
+
+Serves synthetic TRANSFORM messages, as PlusServer does for the OptiTrack, so that
+tracking can be load-tested without hardware. This file only depends on the Python
+standard library and can be run as a script outside of Slicer::
+
+    PythonSlicer TrackerSimulator.py --rate 240 --jitter 0.2 --dropout-rate 0.1
+
+By default, a pointer moving along a circle, a static head frame and the derived
+PointerToHeadFrame transform are sent, matching the names used by the Registration module.
+"""
+
+import argparse
+import math
+import random
+import socket
+import struct
+import threading
+import time
+
+IGTL_HEADER_FORMAT = ">H12s20sQQQ"
+IGTL_TRANSFORM_BODY_FORMAT = ">12f"
+IGTL_TRANSFORM_BODY_SIZE = struct.calcsize(IGTL_TRANSFORM_BODY_FORMAT)
+
+_CRC64_POLY = 0x42F0E1EBA9EA3693
+_CRC64_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def _crc64Table():
+    table = []
+    for i in range(256):
+        crc = i << 56
+        for _ in range(8):
+            crc = ((crc << 1) ^ _CRC64_POLY) if crc & (1 << 63) else (crc << 1)
+        table.append(crc & _CRC64_MASK)
+    return table
+
+
+_CRC64_TABLE = _crc64Table()
+
+
+def crc64(data):
+    """CRC-64 (ECMA-182) as used by OpenIGTLink to check message bodies."""
+    crc = 0
+    for byte in data:
+        crc = _CRC64_TABLE[((crc >> 56) ^ byte) & 0xFF] ^ ((crc << 8) & _CRC64_MASK)
+    return crc
+
+
+def packTransformMessage(deviceName, matrix, timestamp=None):
+    """Pack a 4x4 row-major matrix (nested lists) into an OpenIGTLink v1 TRANSFORM message."""
+    if timestamp is None:
+        timestamp = time.time()
+    body = struct.pack(
+        IGTL_TRANSFORM_BODY_FORMAT,
+        # Rotation is stored column by column, followed by the translation
+        matrix[0][0], matrix[1][0], matrix[2][0],
+        matrix[0][1], matrix[1][1], matrix[2][1],
+        matrix[0][2], matrix[1][2], matrix[2][2],
+        matrix[0][3], matrix[1][3], matrix[2][3],
+    )  # fmt: skip
+    seconds = int(timestamp)
+    fraction = int((timestamp - seconds) * 2**32) & 0xFFFFFFFF
+    header = struct.pack(
+        IGTL_HEADER_FORMAT,
+        1,
+        b"TRANSFORM",
+        deviceName.encode("ascii")[:20],
+        (seconds << 32) | fraction,
+        len(body),
+        crc64(body),
+    )
+    return header + body
+
+
+def _multiply(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+
+def _invertRigid(m):
+    rotation = [[m[j][i] for j in range(3)] for i in range(3)]
+    translation = [-sum(rotation[i][k] * m[k][3] for k in range(3)) for i in range(3)]
+    return [[*rotation[i], translation[i]] for i in range(3)] + [[0.0, 0.0, 0.0, 1.0]]
+
+
+def _rotationZ(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]
+
+
+def _pose(rotation, translation):
+    return [[*rotation[i], translation[i]] for i in range(3)] + [[0.0, 0.0, 0.0, 1.0]]
+
+
+def staticPath(position=(0.0, 0.0, 0.0)):
+    """Return a path holding a fixed position, with identity rotation."""
+    pose = _pose(_rotationZ(0.0), list(position))
+    return lambda t: pose
+
+
+def circlePath(center=(0.0, 0.0, 0.0), radius=50.0, period=4.0):
+    """Return a path moving along a circle in the XY plane, facing the direction of motion."""
+
+    def path(t):
+        angle = 2.0 * math.pi * t / period
+        translation = [center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle), center[2]]
+        return _pose(_rotationZ(angle), translation)
+
+    return path
+
+
+def lissajousPath(center=(0.0, 0.0, 0.0), amplitude=(60.0, 40.0, 20.0), periods=(5.0, 3.0, 7.0)):
+    """Return a path sweeping a 3D Lissajous curve, as when tracing a surface."""
+
+    def path(t):
+        translation = [center[i] + amplitude[i] * math.sin(2.0 * math.pi * t / periods[i]) for i in range(3)]
+        return _pose(_rotationZ(0.3 * math.sin(t)), translation)
+
+    return path
+
+
+class SimulatedTool:
+    """A transform sent by the simulator.
+
+    :param name: OpenIGTLink device name, e.g. ``PointerToTracker``.
+    :param path: Callable returning the 4x4 pose (nested lists) at a time in seconds.
+    :param positionJitter: Standard deviation (mm) of the gaussian noise added to the translation.
+    :param dropoutRate: Mean number of dropouts per second during which the tool is not sent.
+    :param dropoutDuration: Mean dropout duration in seconds (exponentially distributed).
+    """
+
+    def __init__(self, name, path, positionJitter=0.0, dropoutRate=0.0, dropoutDuration=0.2):
+        self.name = name
+        self.path = path
+        self.positionJitter = positionJitter
+        self.dropoutRate = dropoutRate
+        self.dropoutDuration = dropoutDuration
+        self.dropoutEndTime = 0.0
+
+    def pose(self, t):
+        matrix = [row[:] for row in self.path(t)]
+        if self.positionJitter > 0:
+            for i in range(3):
+                matrix[i][3] += random.gauss(0.0, self.positionJitter)
+        return matrix
+
+    def isVisible(self, t, dt):
+        if t < self.dropoutEndTime:
+            return False
+        if self.dropoutRate > 0 and random.random() < self.dropoutRate * dt:
+            self.dropoutEndTime = t + random.expovariate(1.0 / self.dropoutDuration)
+            return False
+        return True
+
+
+class RelativeTool:
+    """A transform computed from two simulated tools, as ``PointerToHeadFrame`` in PlusServer.
+
+    It is only sent when both tools are visible.
+    """
+
+    def __init__(self, name, fromTool, toTool):
+        self.name = name
+        self.fromTool = fromTool
+        self.toTool = toTool
+
+
+class TrackerSimulator:
+    """OpenIGTLink server streaming simulated tool transforms to any connected client.
+
+    :param tools: :class:`SimulatedTool` and :class:`RelativeTool` to send. Defaults to
+      :func:`defaultTools`.
+    :param rate: Frames per second, each frame sending one message per visible tool.
+    :param timingJitter: Standard deviation of the frame period, as a fraction of the period.
+    """
+
+    def __init__(self, tools=None, rate=120.0, timingJitter=0.0, host="localhost", port=18944):
+        self.tools = tools if tools is not None else defaultTools()
+        self.rate = rate
+        self.timingJitter = timingJitter
+        self.host = host
+        self.port = port
+        self.clients = []
+        self.framesSent = 0
+        self.messagesSent = 0
+        self.serverSocket = None
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.serverSocket.bind((self.host, self.port))
+        self.serverSocket.listen()
+        self.serverSocket.setblocking(False)
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, name="TrackerSimulator", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        if self.serverSocket is not None:
+            self.serverSocket.close()
+            self.serverSocket = None
+
+    def acceptClients(self):
+        try:
+            while True:
+                client, address = self.serverSocket.accept()
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.clients.append(client)
+                print(f"TrackerSimulator: client connected from {address}")
+        except BlockingIOError:
+            pass
+
+    def frameMessages(self, t, dt):
+        now = time.time()
+        poses = {}
+        messages = []
+        for tool in self.tools:
+            if isinstance(tool, SimulatedTool) and tool.isVisible(t, dt):
+                poses[tool.name] = tool.pose(t)
+                messages.append(packTransformMessage(tool.name, poses[tool.name], now))
+        for tool in self.tools:
+            if isinstance(tool, RelativeTool) and tool.fromTool in poses and tool.toTool in poses:
+                matrix = _multiply(_invertRigid(poses[tool.toTool]), poses[tool.fromTool])
+                messages.append(packTransformMessage(tool.name, matrix, now))
+        return messages
+
+    def send(self, data):
+        for client in list(self.clients):
+            try:
+                client.sendall(data)
+            except OSError:
+                client.close()
+                self.clients.remove(client)
+
+    def run(self):
+        period = 1.0 / self.rate
+        startTime = time.perf_counter()
+        nextFrameTime = startTime
+        lastFrameTime = startTime
+        while not self.stopEvent.is_set():
+            self.acceptClients()
+
+            frameTime = time.perf_counter()
+            messages = self.frameMessages(frameTime - startTime, frameTime - lastFrameTime)
+            lastFrameTime = frameTime
+            if self.clients and messages:
+                self.send(b"".join(messages))
+                self.messagesSent += len(messages)
+            self.framesSent += 1
+
+            nextFrameTime += period
+            if self.timingJitter > 0:
+                nextFrameTime += random.gauss(0.0, self.timingJitter * period)
+            # Do not try to catch up after a stall, as a real tracker would not either
+            nextFrameTime = max(nextFrameTime, time.perf_counter())
+            self.stopEvent.wait(nextFrameTime - time.perf_counter())
+
+
+def defaultTools(positionJitter=0.0, dropoutRate=0.0, dropoutDuration=0.2):
+    """Return the tools sent by PlusServer with the OpenNav configuration.
+
+    The pointer sweeps in front of a static head frame, about 1 m from the camera.
+    """
+    return [
+        SimulatedTool("PointerToTracker", lissajousPath(center=(0.0, 0.0, -1000.0)), positionJitter, dropoutRate, dropoutDuration),
+        SimulatedTool("HeadFrameToTracker", staticPath((0.0, 100.0, -1000.0)), positionJitter, dropoutRate, dropoutDuration),
+        RelativeTool("PointerToHeadFrame", "PointerToTracker", "HeadFrameToTracker"),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate an OpenIGTLink tracker (PlusServer) streaming tool transforms.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=18944)
+    parser.add_argument("--rate", type=float, default=120.0, help="frames per second (default: 120)")
+    parser.add_argument("--timing-jitter", type=float, default=0.0, help="frame period standard deviation, as a fraction of the period")
+    parser.add_argument("--jitter", type=float, default=0.0, help="position noise standard deviation in mm")
+    parser.add_argument("--dropout-rate", type=float, default=0.0, help="mean number of dropouts per second and per tool")
+    parser.add_argument("--dropout-duration", type=float, default=0.2, help="mean dropout duration in seconds")
+    parser.add_argument("--extra-tools", type=int, default=0, help="number of additional moving tools (Tool<N>ToTracker)")
+    args = parser.parse_args(argv)
+
+    tools = defaultTools(args.jitter, args.dropout_rate, args.dropout_duration)
+    for i in range(args.extra_tools):
+        path = circlePath(center=(0.0, 0.0, -1000.0), radius=30.0 + 10.0 * i, period=3.0 + i)
+        tools.append(SimulatedTool(f"Tool{i}ToTracker", path, args.jitter, args.dropout_rate, args.dropout_duration))
+
+    simulator = TrackerSimulator(tools, rate=args.rate, timingJitter=args.timing_jitter, host=args.host, port=args.port)
+    simulator.start()
+    print(f"TrackerSimulator: serving {len(tools)} tools at {args.rate:g} Hz on {args.host}:{args.port}", flush=True)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+from .ConnectionManager import *  # noqa: F401
+from .TrackerSimulator import *  # noqa: F401
+from .SessionRecorder import *  # noqa: F401
+from .SessionPlayer import *  # noqa: F401
+from .LatencyMonitor import *  # noqa: F401
+from .MetricsExporter import *  # noqa: F401
+from .NodeRegistry import *  # noqa: F401
+from .PlusConfigManager import *  # noqa: F401
+from .ProcessSupervisor import *  # noqa: F401
+from .TrackerFusion import *  # noqa: F401
@@ -1,5 +1,8 @@
+import datetime
 import math
+import os
 import re
+import time
 
 import qt
 import slicer
@@ -8,14 +11,15 @@ import vtk
 from slicer.ScriptedLoadableModule import (
     ScriptedLoadableModule,
     ScriptedLoadableModuleLogic,
+    ScriptedLoadableModuleTest,
     ScriptedLoadableModuleWidget,
 )
 
 import OpenNavUtils
 
 from LandmarkManager import Landmarks
-from RegistrationUtils import Tools, Trace, TracingState
-import numpy as np
+import OptiTrack
+from RegistrationUtils import PointerTipProvider, PoseFilterStage, SkinCoverageMap, SkinResiduals, Tools, ToolStatistics, Trace, TraceAcquisitionFilter, TraceArchive, TracingState, createPoseFilter, residualStatistics
 
 
 class Registration(ScriptedLoadableModule):
@@ -27,7 +31,7 @@ class Registration(ScriptedLoadableModule):
         ScriptedLoadableModule.__init__(self, parent)
         self.parent.title = "OpenNav Registration"
         self.parent.categories = ["OpenNav.Workflows"]
-        self.parent.dependencies = ["PivotCalibration", "CreateModels", "Planning", "LandmarkManager"]
+        self.parent.dependencies = ["PivotCalibration", "CreateModels", "Planning", "LandmarkManager", "OptiTrack"]
         self.parent.contributors = ["Samuel Gerber (Kitware Inc.)"]
         self.parent.helpText = """
 This is the Registration main module for the OpenNav application
@@ -47,6 +51,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
     def __init__(self, parent):
         super().__init__(parent)
         self.traceObserver = None
+        self.pointerTip = PointerTipProvider()
+        self.traceFilter = TraceAcquisitionFilter()
 
         # Load widget from .ui file (created by Qt Designer)
         self.uiWidget = slicer.util.loadUI(self.resourcePath("UI/Registration.ui"))
@@ -76,6 +82,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.RMSE_REGISTRATION_OK = 3.0
         self.RMSE_INITIAL_REGISTRATION_OK = 5.0
         self.RMSE_INITIAL_REGISTRATION_CONDITIONAL = 15.0
+        # Off-skin trace samples are rejected beyond this multiple of the landmark registration RMSE, at least
+        self.SKIN_DISTANCE_RMSE_FACTOR = 2.0
         self.EPSILON = 0.00001
         self.optitrack_pending = False
 
@@ -126,13 +134,17 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         addSecondaryTab("surface-registration", "Refine registration")
         addSecondaryTab("verify-registration", "Verify registration")
 
-        import OptiTrack
-
         self.optitrack = OptiTrack.OptiTrackLogic()
         self.optitrack.setExpectedNodes(["PointerToHeadFrame", "PointerToTracker", "HeadFrameToTracker"])
+        self.optitrack.addStateObserver(self.onOptiTrackStateChanged)
+        self.optiTrackStartingBox = None
 
         self.preloadPictures()
         self.setupToolTables()
+        self.optitrack.metricsExporter.addCollector(self.tools.collectMetrics)
+        metricsPath = qt.QSettings().value(OptiTrack.OptiTrackWidget.METRICS_PATH_SETTING)
+        if metricsPath:
+            self.optitrack.startMetricsExport(metricsPath)
         self.setupLandmarkTables()
 
         self.pivotLogic = slicer.vtkSlicerPivotCalibrationLogic()
@@ -161,10 +173,19 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
 
         self.trace = Trace()
         self.trace.setVisible(False)
+        self.coverage = SkinCoverageMap()
+        self.traceArchive = TraceArchive()
+        # Bound in the surface registration step only
+        self.undoTraceShortcut = qt.QShortcut(qt.QKeySequence("Ctrl+z"), slicer.util.mainWindow())
+        self.redoTraceShortcut = qt.QShortcut(qt.QKeySequence("Ctrl+y"), slicer.util.mainWindow())
 
     def cleanup(self):
+        self.optitrack.removeStateObserver(self.onOptiTrackStateChanged)
+        self.optitrack.stopMetricsExport()
         self.optitrack.shutdown()
         self.tools.setToolsStatusCheckEnabled(False)
+        self.pointerTip.setNodes(None, None)
+        self.traceArchive.close()
         self.planningLogic = None
 
     def exit(self):
@@ -175,7 +196,9 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.landmarks.model = slicer.modules.PlanningWidget.logic.skin_model
         self.landmarks.updateLandmarksDisplay()
         self.shortcut.disconnect("activated()")
+        self.disconnectTraceShortcuts()
         self.trace.setVisible(False)
+        self.coverage.setVisible(False)
         self.resetDefaultButtonActions()
 
     def enter(self):
@@ -195,6 +218,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.logic.updateExtensionModels()
         self.setupPivotCalibration()
         self.logic.setupSurfaceErrorComputation()
+        self.coverage.setSkinModel(slicer.modules.PlanningWidget.logic.skin_model)
         self.landmarks.transferPlanningLandmarks(slicer.modules.PlanningWidget.landmarkLogic.positions)
         self.landmarks.syncLandmarks()
 
@@ -308,20 +332,49 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
             motiveFileName = "OpenNav-BWH-Hardware_2024-05-08.xml"
             plusFileName = "PLUSHead.xml.in"
 
-        test = qt.QMessageBox(qt.QMessageBox.Information, "Starting", "Starting tracker", qt.QMessageBox.NoButton)
-        test.setStandardButtons(0)
-        test.show()
-        slicer.app.processEvents()
-        test.deleteLater()
+        # Modal so that the workflow cannot be re-entered while the tracker is starting
+        self.optiTrackStartingBox = qt.QMessageBox(qt.QMessageBox.Information, "Starting", "Starting tracker", qt.QMessageBox.Cancel, slicer.util.mainWindow())
+        self.optiTrackStartingBox.setModal(True)
+        self.optiTrackStartingBox.rejected.connect(self.optitrack.cancelStartup)
+        self.optiTrackStartingBox.show()
         self.optitrack.start(self.optitrack.getPlusLauncherPath(), self.resourcePath(plusFileName), self.resourcePath(motiveFileName))
-        test.hide()
-        self.optitrack_pending = False
 
-        if not self.optitrack.isRunning:
-            qt.QMessageBox.warning(slicer.util.mainWindow(), "Tracker not connected", "Tracker not connected")
-            self.advanceButton.enabled = False
-        else:
+    def onOptiTrackStateChanged(self, state, message):
+        if self.optiTrackStartingBox is not None:
+            self.optiTrackStartingBox.text = message
+
+        if state == OptiTrack.OptiTrackState.CONNECTED:
+            self.hideOptiTrackStartingBox()
+            self.optitrack_pending = False
+            self.startTrackingRecording()
             qt.QTimer.singleShot(10, self.logic.reconnect)
+        elif state == OptiTrack.OptiTrackState.FAILED:
+            self.hideOptiTrackStartingBox()
+            self.optitrack_pending = False
+            qt.QMessageBox.warning(slicer.util.mainWindow(), "Tracker not connected", "Tracker not connected: " + message)
+            self.advanceButton.enabled = False
+        elif state == OptiTrack.OptiTrackState.IDLE and self.optitrack_pending:
+            self.hideOptiTrackStartingBox()
+            self.cancelOptiTrack()
+
+    def startTrackingRecording(self):
+        if self.optitrack.recorder.isRecording:
+            return
+        trackingDirectory = OpenNavUtils.caseSubdirectory(slicer.modules.PlanningWidget.logic.case_name, "Tracking")
+        if not trackingDirectory:
+            print("Case not saved yet, tracking session not recorded")
+            return
+        fileName = "Tracking-" + datetime.datetime.now().strftime("%Y-%m-%d_T%H-%M-%S") + ".trk"
+        self.optitrack.startRecording(os.path.join(trackingDirectory, fileName))
+
+    def hideOptiTrackStartingBox(self):
+        if self.optiTrackStartingBox is None:
+            return
+        box = self.optiTrackStartingBox
+        self.optiTrackStartingBox = None
+        box.rejected.disconnect()
+        box.hide()
+        box.deleteLater()
 
     def cancelOptiTrack(self):
         self.optitrack_pending = False
@@ -334,10 +387,12 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.landmarks.model = slicer.modules.PlanningWidget.logic.skin_model
         self.landmarks.updateLandmarksDisplay()
         self.trace.setVisible(False)
+        self.coverage.setVisible(False)
 
         self.tools.setToolsStatusCheckEnabled(False)
 
         self.shortcut.disconnect("activated()")
+        self.disconnectTraceShortcuts()
 
     @OpenNavUtils.backButton(text="Return to Planning")
     @OpenNavUtils.advanceButton(text="Setup OpenNav")
@@ -451,6 +506,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.pivotLogic.ComputePivotCalibration()
         self.pivotLogic.GetToolTipToToolMatrix(outputMatrix)
         self.logic.pointer_calibration.SetMatrixTransformToParent(outputMatrix)
+        # Calibration records the raw pointer, put the pose filter back in the chain
+        self.logic.updatePointerFilter()
 
         RMSE = self.pivotLogic.GetPivotRMSE()
         RMSE_label = f"{RMSE:1.2f}"
@@ -560,6 +617,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.pivotLogic.ComputeSpinCalibration()
         self.pivotLogic.GetToolTipToToolMatrix(outputMatrix)
         self.logic.pointer_calibration.SetMatrixTransformToParent(outputMatrix)
+        # Calibration records the raw pointer, put the pose filter back in the chain
+        self.logic.updatePointerFilter()
 
         RMSE = math.degrees(self.pivotLogic.GetSpinRMSE())
 
@@ -604,6 +663,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         # Set the layout
         OpenNavUtils.goToRegistrationCameraViewLayout()
         self.AlignmentSideWidget.visible = True
+        self.coverage.setVisible(False)
         self.planningLogic.setPlanningNodesVisibility(skinModel=False, seedSegmentation=False, targetSegmentation=False, trajectory=False, landmarks=False)
 
         # Clear previous registration
@@ -637,6 +697,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
 
         self.shortcut.disconnect("activated()")
         self.shortcut.connect("activated()", self.onCollectButton)
+        self.disconnectTraceShortcuts()
 
     @OpenNavUtils.backButton(text="Restart registration")
     @OpenNavUtils.advanceButton(text="Continue")
@@ -656,6 +717,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.trace.setVisible(True)
         self.addLandmarksToTrace()
         self.planningLogic.setPlanningNodesVisibility(skinModel=True, seedSegmentation=False, targetSegmentation=False, trajectory=False, landmarks=False)
+        self.coverage.reset(self.trace.points)
+        self.coverage.setVisible(True)
         OpenNavUtils.centerCam()
 
         self.advanceButton.enabled = self.logic.surface_registration_passed
@@ -670,6 +733,9 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
 
         self.shortcut.disconnect("activated()")
         self.shortcut.connect("activated()", self.onTraceButton)
+        self.disconnectTraceShortcuts()
+        self.undoTraceShortcut.connect("activated()", self.onUndoTrace)
+        self.redoTraceShortcut.connect("activated()", self.onRedoTrace)
 
     @OpenNavUtils.backButton(text="Restart registration")
     @OpenNavUtils.advanceButton(text="Accept", enabled=False)
@@ -679,6 +745,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         OpenNavUtils.goToNavigationLayout(volumeNode=sourceNode, mainPanelVisible=True)
         self.tools.setToolsStatusCheckEnabled(True)
         self.AlignmentSideWidget.visible = False
+        self.coverage.setVisible(False)
         self.planningLogic.setPlanningNodesVisibility(skinModel=True, seedSegmentation=False, targetSegmentation=False, trajectory=False, landmarks=False)
         self.logic.needle_model.GetDisplayNode().SetVisibility(True)
         self.logic.needle_model.GetDisplayNode().SetVisibility2D(True)
@@ -695,6 +762,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.ui.GoToTracingButton.clicked.connect(self.workflow.gotoPrev)
 
         self.shortcut.disconnect("activated()")
+        self.disconnectTraceShortcuts()
         if self.logic.surface_registration_passed and self.logic.landmark_registration_passed:
             self.shortcut.connect("activated()", self.workflow.gotoNext)
         elif self.logic.landmark_registration_passed:
@@ -708,7 +776,6 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
             for _name, position in defs.positions.items():
                 self.trace.addPoint(position)
             self.trace.initialized_with_landmarks = True
-            self.trace.lastAcquisitionLength = 0
 
     def resetDefaultButtonActions(self):
         self.disconnectAll(self.backButton)
@@ -769,6 +836,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
                 match = search.group()
 
                 RMSE = float(match)
+                self.logic.landmark_registration_rmse = RMSE
 
                 # Automatic pass
                 if RMSE < self.RMSE_INITIAL_REGISTRATION_OK:
@@ -808,14 +876,10 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
             self.logic.pointer_to_headframe.SetAndObserveTransformNodeID(None)
         else:
             print("Warning:  tracker not connected")
+            return
 
-        samplePoint = [0, 0, 0]
-        outputPoint = [0, 0, 0]
-        transform = vtk.vtkGeneralTransform()
-        slicer.vtkMRMLTransformNode.GetTransformBetweenNodes(self.logic.pointer_calibration, None, transform)
-        transform.TransformPoint(samplePoint, outputPoint)
-        # print(outputPoint)
-        self.landmarks.collectLandmarkPosition(outputPoint)
+        self.pointerTip.setNodes(self.logic.pointer_to_headframe, self.logic.pointer_calibration)
+        self.landmarks.collectLandmarkPosition(self.pointerTip.position().tolist())
         if self.landmarks.landmarksFinished:
             print("landmarks finished")
             self.shortcut.disconnect("activated()")
@@ -830,7 +894,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
 
     def setupToolTables(self):
         self.logic.setupNeedleModel()
-        self.tools = Tools(self.AlignmentSideWidgetui.SeenTableWidget, self.AlignmentSideWidgetui.UnseenTableWidget, self.moduleName)
+        self.tools = Tools(self.AlignmentSideWidgetui.SeenTableWidget, self.AlignmentSideWidgetui.UnseenTableWidget, self.moduleName, self.AlignmentSideWidgetui.StatisticsTableWidget)
         node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "Pointer")
         node.AddControlPoint(0, 0, 0, "Pointer")
         node.SaveWithSceneOff()
@@ -860,21 +924,56 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
     def onResetTraceButton(self):
         self.resetTrace()
         self.addLandmarksToTrace()
+        self.coverage.reset(self.trace.points)
         self.shortcut.disconnect("activated()")
         self.shortcut.connect("activated()", self.onTraceButton)
 
-    def resetTrace(self):
-        print("Reset trace")
-        self.trace.clearTrace()
+    def disconnectTraceShortcuts(self):
+        self.undoTraceShortcut.disconnect("activated()")
+        self.redoTraceShortcut.disconnect("activated()")
+
+    def onUndoTrace(self):
+        if self.trace.state == TracingState.IN_PROGRESS or not self.trace.undoAcquisition():
+            return
+        print("Undo trace acquisition")
+        self.onTraceAcquisitionsChanged()
+
+    def onRedoTrace(self):
+        if self.trace.state == TracingState.IN_PROGRESS or not self.trace.redoAcquisition():
+            return
+        print("Redo trace acquisition")
+        self.onTraceAcquisitionsChanged()
+
+    def onTraceAcquisitionsChanged(self):
+        self.coverage.reset(self.trace.points)
+        if self.trace.canUndo:
+            # Register again with the remaining points, staying in this step
+            self.registerTrace(advance=False)
+        else:
+            # Only the landmarks are left
+            self.clearSurfaceRegistration()
+            self.advanceButton.enabled = False
+
+    def clearSurfaceRegistration(self):
+        self.trace.state = TracingState.NOT_STARTED
         self.ui.TraceButton.text = "Start collection"
+        self.ui.SurfaceRegMessage.text = ""
         if self.logic.surface_registration_transform:
             self.logic.surface_registration_transform.SetMatrixTransformToParent(vtk.vtkMatrix4x4())
         self.logic.surface_registration_passed = False
 
+    def resetTrace(self):
+        print("Reset trace")
+        self.trace.clearTrace()
+        self.ui.TraceStatisticsLabel.text = ""
+        # The next acquisitions are a new registration attempt
+        self.traceArchive.close()
+        self.clearSurfaceRegistration()
+
     def startTracing(self):
         print("Start tracing")
         self.trace.state = TracingState.IN_PROGRESS
-        self.trace.lastAcquisitionLength = 0
+        self.trace.startAcquisition()
         self.ui.TraceButton.text = "Stop collection"
 
         if self.logic.landmark_registration_transform:
@@ -882,6 +981,11 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         else:
             print("Warning:  tracker not connected")
 
+        self.pointerTip.setNodes(self.logic.pointer_to_headframe, self.logic.pointer_calibration)
+        self.traceFilter = TraceAcquisitionFilter(**self.logic.trace_filter_settings)
+        self.setupOffSkinRejection()
+        self.traceFilter.reset(self.trace.points)
+        self.startTraceArchiving()
         try:
             self.traceObserver = self.logic.pointer_to_headframe.AddObserver(slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.doTracing)
         except:
@@ -894,27 +998,34 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.shortcut.connect("activated()", self.onTraceButton)
 
     def stopTracing(self):
-        messageBox = qt.QMessageBox(qt.QMessageBox.Information, "Computing", "Computing registration", qt.QMessageBox.NoButton)
-        messageBox.setStandardButtons(0)
-        messageBox.show()
-        slicer.app.processEvents()
-        messageBox.deleteLater()
-
         print("Stop tracing")
         if self.traceObserver is not None:
             self.logic.pointer_to_headframe.RemoveObserver(self.traceObserver)
             self.traceObserver = None
         else:
             print("[Registration::stopTracing]Was not recording, nothing to do.")
+        print(f"Trace acquisition: {self.traceFilter.statistics}")
+        self.updateTraceStatistics()
+        self.traceArchive.endAcquisition()
 
-        trace_length = self.trace.traceNode.GetNumberOfControlPoints()
-        if self.trace.traceNode is None or trace_length == 0:
+        self.trace.updateDisplay()
+        if self.trace.numberOfPoints == 0:
             print("[Registration::stopTracing]Not enough points to compute registration.")
             return
         else:
             self.trace.state = TracingState.DONE
             self.ui.TraceButton.text = "Add more points to trace"
 
+        self.registerTrace()
+
+    def registerTrace(self, advance=True):
+        """Run the surface registration on the trace, then go to the next step if it passed and ``advance`` is True."""
+        messageBox = qt.QMessageBox(qt.QMessageBox.Information, "Computing", "Computing registration", qt.QMessageBox.NoButton)
+        messageBox.setStandardButtons(0)
+        messageBox.show()
+        slicer.app.processEvents()
+        messageBox.deleteLater()
+
         # Remove correction transform to compute the error without it
         backup = vtk.vtkMatrix4x4()
         identity = vtk.vtkMatrix4x4()
@@ -922,7 +1033,7 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         self.logic.surface_registration_transform.SetMatrixTransformToParent(identity)
 
         # Compute average error on trace without correction
-        avg_dist_before, tracing_points = self.computeTraceError()
+        avg_dist_before, tracing_points, _ = self.computeTraceError()
         print("Average distance trace to skin surface before registration: " + str(avg_dist_before))
 
         # Re-set the correction transform
@@ -934,15 +1045,16 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
             self.logic.surface_registration_transform.SetMatrixTransformToParent(transformMatrix)
             if self.logic.landmark_registration_transform:
                 self.logic.landmark_registration_transform.SetAndObserveTransformNodeID(self.logic.surface_registration_transform.GetID())
-                self.trace.traceNode.SetAndObserveTransformNodeID(self.logic.surface_registration_transform.GetID())
+                self.trace.setAndObserveTransformNodeID(self.logic.surface_registration_transform.GetID())
             else:
                 print("[Registration::stopTracing]Warning: tracker not connected")
         else:
             print("[Registration::stopTracing]Surface registration failed.")
 
         # Compute average error on trace with correction
-        avg_dist_after, _ = self.computeTraceError()
+        avg_dist_after, _, distances_after = self.computeTraceError()
         print("Average distance trace to skin surface after registration: " + str(avg_dist_after))
+        self.trace.setScalars(distances_after, (0.0, 2 * self.RMSE_REGISTRATION_OK))
 
         self.logic.surface_registration_passed = (avg_dist_after - avg_dist_before < 0.0 - self.EPSILON) and (avg_dist_after < self.RMSE_REGISTRATION_OK)
 
@@ -950,7 +1062,8 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
 
         if self.logic.surface_registration_passed:
             self.ui.SurfaceRegMessage.text = ""
-            self.workflow.gotoNext()
+            if advance:
+                self.workflow.gotoNext()
         else:
             self.logic.surface_registration_transform.SetMatrixTransformToParent(identity)
             self.shortcut.disconnect("activated()")
@@ -961,29 +1074,69 @@ class RegistrationWidget(ScriptedLoadableModuleWidget):
         messageBox.hide()
 
     def computeTraceError(self):
-        error = 0
-        trace_length = self.trace.traceNode.GetNumberOfControlPoints()
-        tracing_points = np.zeros((trace_length, 3))
-        for i in range(trace_length):
-            p = [0.0, 0.0, 0.0]
-            self.trace.traceNode.GetNthControlPointPositionWorld(i, p)
-            tracing_points[i, :] = p
-            closest_point_on_surface = [0.0, 0.0, 0.0]
-            cell_id = vtk.reference(0)
-            sub_id = vtk.reference(0)
-            dist2 = vtk.reference(0.0)
-            self.logic.locator.FindClosestPoint(p, closest_point_on_surface, cell_id, sub_id, dist2)
-            error += math.sqrt(dist2)
-        error /= trace_length
-        return error, tracing_points
+        tracing_points = self.trace.worldPoints()
+        distances = self.logic.skin_residuals.compute(tracing_points)
+        statistics = residualStatistics(distances)
+        print("Trace to skin surface distances: " + ", ".join(f"{name} {value:.2f}" for name, value in statistics.items() if name != "count"))
+        return statistics["mean"], tracing_points, distances
+
+    def setupOffSkinRejection(self):
+        """Reject trace samples off the skin, measured with the current registration applied.
+
+        The accepted distance grows with the landmark registration error, so that correct samples
+        are kept when a poor landmark registration was accepted, which the trace is meant to fix.
+        """
+        rmse = self.logic.landmark_registration_rmse
+        if not self.logic.landmark_registration_passed or rmse is None:
+            self.traceFilter.skinDistance = None
+            return
+        # Leaves the configured maxSkinDistance untouched, 0 still disables the check
+        self.traceFilter.skinDistanceFloor = self.SKIN_DISTANCE_RMSE_FACTOR * rmse
+
+        # Samples are in the landmark registration space, the surface registration refines it
+        surfaceRegistration = vtk.vtkTransform()
+        if self.logic.surface_registration_transform:
+            matrix = vtk.vtkMatrix4x4()
+            self.logic.surface_registration_transform.GetMatrixTransformToParent(matrix)
+            surfaceRegistration.SetMatrix(matrix)
+        registeredPoint = [0.0, 0.0, 0.0]
+
+        def skinDistance(point):
+            surfaceRegistration.TransformPoint(point, registeredPoint)
+            return self.logic.distanceToSkin(registeredPoint)
+
+        self.traceFilter.skinDistance = skinDistance
+
+    def updateTraceStatistics(self):
+        statistics = self.traceFilter.statistics
+        if statistics["accepted"] + self.traceFilter.rejectedCount == 0:
+            self.ui.TraceStatisticsLabel.text = ""
+            return
+        self.ui.TraceStatisticsLabel.text = f"{statistics['accepted']} points added, {statistics['offSkin']} off the skin, {statistics['tooFast']} moving too fast, {statistics['tooClose'] + statistics['overBudget']} redundant"
+
+    def startTraceArchiving(self):
+        if not self.traceArchive.isOpen:
+            traceDirectory = OpenNavUtils.caseSubdirectory(slicer.modules.PlanningWidget.logic.case_name, "Traces")
+            if not traceDirectory:
+                print("Case not saved yet, trace not archived")
+                return
+            fileName = "Trace-" + datetime.datetime.now().strftime("%Y-%m-%d_T%H-%M-%S") + ".trc"
+            self.traceArchive.open(os.path.join(traceDirectory, fileName), {"case": slicer.modules.PlanningWidget.logic.case_name})
+        landmarkTransform = vtk.vtkMatrix4x4()
+        if self.logic.landmark_registration_transform:
+            self.logic.landmark_registration_transform.GetMatrixTransformToParent(landmarkTransform)
+        elements = [0.0] * 16
+        vtk.vtkMatrix4x4.DeepCopy(elements, landmarkTransform)
+        self.traceArchive.startAcquisition(elements)
 
     def doTracing(self, transformNode=None, unusedArg2=None, unusedArg3=None):
-        samplePoint = [0, 0, 0]
-        outputPoint = [0, 0, 0]
-        transform = vtk.vtkGeneralTransform()
-        slicer.vtkMRMLTransformNode.GetTransformBetweenNodes(self.logic.pointer_calibration, None, transform)
-        transform.TransformPoint(samplePoint, outputPoint)
-        self.trace.addPoint(outputPoint)
+        position = self.pointerTip.position()
+        timestamp = time.time()
+        accepted = self.traceFilter.accept(position, timestamp)
+        self.traceArchive.addSample(position, timestamp, accepted)
+        if accepted:
+            self.trace.addPoint(position)
+            self.coverage.addPoint(position)
 
     def setupLandmarkTables(self):
         self.landmarks = Landmarks(self.ui.RegistrationWidget.RegistrationStepLandmarkRegistration.LandmarkTableWidget, self.moduleName, self.ui.CollectButton)
@@ -1026,13 +1179,21 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
     pivot_calibration_passed = OpenNavUtils.parameterProperty("PIVOT_CALIBRATION_PASSED", default=False)
     spin_calibration_passed = OpenNavUtils.parameterProperty("SPIN_CALIBRATION_PASSED", default=False)
     landmark_registration_passed = OpenNavUtils.parameterProperty("LANDMARK_REGISTRATION_PASSED", default=False)
+    landmark_registration_rmse = OpenNavUtils.parameterProperty("LANDMARK_REGISTRATION_RMSE", default=None)
     surface_registration_passed = OpenNavUtils.parameterProperty("SURFACE_REGISTRATION_PASSED", default=False)
+    # Pose filter settings per tool name, see RegistrationUtils.createPoseFilter
+    pose_filters = OpenNavUtils.parameterProperty("POSE_FILTERS", factory=dict)
+    # Update the displayed pointer at most once per frame, tracing still gets every sample
+    coalesce_pointer_updates = OpenNavUtils.parameterProperty("COALESCE_POINTER_UPDATES", default=True)
+    # Keyword arguments of TraceAcquisitionFilter, e.g. {"minSpacing": 2.0, "maxVelocity": 300.0}
+    trace_filter_settings = OpenNavUtils.parameterProperty("TRACE_FILTER_SETTINGS", factory=dict)
 
     # Not a reference property, since we DO NOT want any reference to this saved with the scene
     # This node should only exists when the tracker is running
     pointer_to_headframe = None
+    pointer_filter_stage = None
     needle_model = None
-    locator = None
+    skin_residuals = None
     odd_extensions = None
     even_extensions = None
     half_seg_transform = None
@@ -1049,6 +1210,7 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
         self.pivot_calibration_passed = False
         self.spin_calibration_passed = False
         self.landmark_registration_passed = False
+        self.landmark_registration_rmse = None
         self.surface_registration_passed = False
 
     def setupPointerCalibration(self):
@@ -1083,6 +1245,7 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
             identityMatrix = vtk.vtkMatrix4x4()
             self.surface_registration_transform.SetMatrixTransformToParent(identityMatrix)
         self.landmark_registration_passed = False
+        self.landmark_registration_rmse = None
         self.surface_registration_passed = False
 
     def reconnect(self):
@@ -1096,8 +1259,7 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
                 )
             self.pointer_to_headframe.SaveWithSceneOff()
 
-        if self.pointer_calibration and self.pointer_to_headframe:
-            self.pointer_calibration.SetAndObserveTransformNodeID(self.pointer_to_headframe.GetID())
+        self.updatePointerFilter()
 
         if self.needle_model and self.odd_extensions and self.even_extensions and self.pointer_calibration:
             self.needle_model.SetAndObserveTransformNodeID(self.pointer_calibration.GetID())
@@ -1110,6 +1272,38 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
         if self.surface_registration_transform and self.landmark_registration_transform:
             self.landmark_registration_transform.SetAndObserveTransformNodeID(self.surface_registration_transform.GetID())
 
+    def pointerFilterSettings(self):
+        return self.pose_filters.get("Pointer", {"type": "none"})
+
+    def setPointerFilterSettings(self, settings):
+        poseFilters = self.pose_filters
+        poseFilters["Pointer"] = settings
+        self.pose_filters = poseFilters
+        self.updatePointerFilter()
+
+    def updatePointerFilter(self):
+        """Insert the pointer pose filter between the tracked pointer and its calibration, if enabled.
+
+        The stage is also used without filter to coalesce pointer updates to the display rate.
+        """
+        if not self.pointer_to_headframe:
+            return
+        if self.pointer_filter_stage is None:
+            self.pointer_filter_stage = PoseFilterStage("PointerToHeadFrameFiltered")
+
+        poseFilter = createPoseFilter(self.pointerFilterSettings())
+        self.pointer_filter_stage.setFilter(poseFilter)
+        self.pointer_filter_stage.coalesce = self.coalesce_pointer_updates
+        if poseFilter is None and not self.coalesce_pointer_updates:
+            self.pointer_filter_stage.setInputNode(None)
+            pointerNode = self.pointer_to_headframe
+        else:
+            self.pointer_filter_stage.setInputNode(self.pointer_to_headframe)
+            pointerNode = self.pointer_filter_stage.outputNode
+
+        if self.pointer_calibration:
+            self.pointer_calibration.SetAndObserveTransformNodeID(pointerNode.GetID())
+
     def setupNeedleModel(self):
         createModelsLogic = slicer.modules.createmodels.logic()
         self.needle_model = createModelsLogic.CreateNeedle(100.0, 1.0, 2.5, False)
@@ -1206,11 +1400,12 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
         self.reconnect()
 
     def setupSurfaceErrorComputation(self):
-        self.locator = vtk.vtkCellLocator()
-        self.locator.SetDataSet(slicer.modules.PlanningWidget.logic.skin_model.GetPolyData())
-        self.locator.SetNumberOfCellsPerBucket(1)
-        self.locator.BuildLocator()
-        self.locator.Update()
+        self.skin_residuals = SkinResiduals()
+        self.skin_residuals.setSurface(slicer.modules.PlanningWidget.logic.skin_model.GetPolyData())
+
+    def distanceToSkin(self, point):
+        """Return the distance in mm from ``point``, in image coordinates, to the skin model."""
+        return self.skin_residuals.distance(point)
 
     def runSurfaceRegistration(self, tracePoints):
         skin_model_polydata = slicer.modules.PlanningWidget.logic.skin_model.GetPolyData()
@@ -1223,3 +1418,39 @@ class RegistrationLogic(ScriptedLoadableModuleLogic):
         icp.SetSource(OpenNavUtils.createPolyData(tracePoints))
         icp.Update()
         return icp.GetMatrix()
+
+
+class RegistrationTest(ScriptedLoadableModuleTest):
+    """Self tests of the registration utilities, run with "Reload and Test"."""
+
+    def runTest(self):
+        self.test_ToolStatisticsRateChange()
+        self.test_ToolStatisticsBurst()
+
+    @staticmethod
+    def addSamples(statistics, timestamp, rate, count):
+        for _ in range(count):
+            timestamp += 1.0 / rate
+            statistics.addSample(timestamp)
+        return timestamp
+
+    def test_ToolStatisticsRateChange(self):
+        """A lower tracker rate becomes the new expected rate after a few dropouts."""
+        statistics = ToolStatistics("Tool")
+        timestamp = self.addSamples(statistics, 0.0, 120.0, 600)
+        timestamp = self.addSamples(statistics, timestamp, 40.0, 1000)
+        summary = statistics.summary(timestamp)
+        self.assertAlmostEqual(summary["rate"], 40.0, places=3)
+        self.assertLessEqual(summary["dropouts"], ToolStatistics.BASELINE_SAMPLES)
+        self.assertLess(summary["lostTime"], 1.0)
+
+    def test_ToolStatisticsBurst(self):
+        """A single short interval does not make the following updates dropouts."""
+        statistics = ToolStatistics("Tool")
+        timestamp = self.addSamples(statistics, 0.0, 120.0, 600)
+        timestamp = self.addSamples(statistics, timestamp, 2000.0, 1)
+        timestamp = self.addSamples(statistics, timestamp, 120.0, 2000)
+        summary = statistics.summary(timestamp)
+        self.assertAlmostEqual(summary["rate"], 120.0, places=3)
+        self.assertEqual(summary["dropouts"], 0)
+        self.assertEqual(summary["lostTime"], 0.0)
@@ -0,0 +1,164 @@
+import numpy as np
+import qt
+import slicer
+import vtk
+
+from vtk.util import numpy_support
+
+
+class SkinCoverageMap:
+    """Show which parts of the skin have been traced, by coloring a copy of the skin model.
+
+    The skin model vertices are binned into :attr:`patchSize` cubes, the patches. A grid of
+    :attr:`lookupSpacing` cells around the skin stores the patch nearest to each cell, for
+    cells within one cell of the surface, so that a trace point is assigned to its patch with
+    one array lookup. Each patch counts its trace points, and the vertices of the copy are
+    colored by the count of their patch, up to :attr:`targetPointsPerPatch`. Colors are
+    updated at most every :attr:`DISPLAY_UPDATE_INTERVAL_MS`.
+
+    Points are expected in the coordinates of the skin model.
+    """
+
+    DISPLAY_UPDATE_INTERVAL_MS = 200
+    VERTICES_PER_CHUNK = 20000
+    SCALARS_NAME = "Coverage"
+
+    def __init__(self, patchSize=15.0, lookupSpacing=4.0, targetPointsPerPatch=5):
+        self.patchSize = patchSize
+        self.lookupSpacing = lookupSpacing
+        self.targetPointsPerPatch = targetPointsPerPatch
+        self.skinModel = None
+        self.skinPolyDataMTime = None
+        self.vertexPatches = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0)
+        self.grid = np.full((0, 0, 0), -1, dtype=int)
+        self.gridOrigin = np.zeros(3)
+        self.vertexCoverage = np.zeros(0)
+        self.displayOutdated = False
+        self.modelNode = None
+
+        self.displayTimer = qt.QTimer()
+        self.displayTimer.singleShot = True
+        self.displayTimer.interval = self.DISPLAY_UPDATE_INTERVAL_MS
+        self.displayTimer.timeout.connect(self.updateDisplay)
+
+    @property
+    def coveredFraction(self):
+        """Fraction of the patches with at least one trace point."""
+        return float(np.count_nonzero(self.hits)) / len(self.hits) if len(self.hits) else 0.0
+
+    def setSkinModel(self, skinModel):
+        """Build the patches and lookup grid of ``skinModel``, unless they are up to date."""
+        polyData = skinModel.GetPolyData() if skinModel else None
+        if polyData is None or polyData.GetNumberOfPoints() == 0:
+            self.skinModel = None
+            return
+        if skinModel is self.skinModel and polyData.GetMTime() == self.skinPolyDataMTime:
+            return
+        self.skinModel = skinModel
+        self.skinPolyDataMTime = polyData.GetMTime()
+        vertices = slicer.util.arrayFromModelPoints(skinModel)
+
+        _, self.vertexPatches = np.unique(np.floor(vertices / self.patchSize).astype(int), axis=0, return_inverse=True)
+        self.vertexPatches = self.vertexPatches.ravel()
+        self.hits = np.zeros(self.vertexPatches.max() + 1)
+
+        self.gridOrigin = vertices.min(axis=0) - 2 * self.lookupSpacing
+        vertexCells = np.floor((vertices - self.gridOrigin) / self.lookupSpacing).astype(int)
+        self.grid = np.full(vertexCells.max(axis=0) + 3, -1, dtype=int)
+        nearestDistances = np.full(self.grid.shape, np.inf)
+        # Candidate cells of a vertex: its cell and the 26 neighbors
+        offsets = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij"), axis=-1).reshape(-1, 3)
+        for start in range(0, len(vertices), self.VERTICES_PER_CHUNK):
+            chunk = slice(start, start + self.VERTICES_PER_CHUNK)
+            cells = (vertexCells[chunk, None, :] + offsets[None, :, :]).reshape(-1, 3)
+            patches = np.repeat(self.vertexPatches[chunk], len(offsets))
+            distances = np.linalg.norm(self.gridOrigin + (cells + 0.5) * self.lookupSpacing - np.repeat(vertices[chunk], len(offsets), axis=0), axis=1)
+            # Nearest vertex of each cell in the chunk, kept if nearer than in previous chunks
+            flatCells = np.ravel_multi_index(cells.T, self.grid.shape)
+            order = np.lexsort((distances, flatCells))
+            _, first = np.unique(flatCells[order], return_index=True)
+            nearest = order[first]
+            nearer = distances[nearest] < nearestDistances.flat[flatCells[nearest]]
+            nearest = nearest[nearer]
+            nearestDistances.flat[flatCells[nearest]] = distances[nearest]
+            self.grid.flat[flatCells[nearest]] = patches[nearest]
+
+        self.createModelNode(polyData)
+        self.reset()
+
+    def createModelNode(self, skinPolyData):
+        if self.modelNode is None:
+            self.modelNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode", "SkinCoverage")
+            self.modelNode.SaveWithSceneOff()
+            self.modelNode.CreateDefaultDisplayNodes()
+            displayNode = self.modelNode.GetDisplayNode()
+            displayNode.SetVisibility(False)
+            displayNode.SetVisibility2D(False)
+            displayNode.SetAndObserveColorNodeID("vtkMRMLColorTableNodeFileViridis.txt")
+            displayNode.SetScalarRangeFlag(slicer.vtkMRMLDisplayNode.UseManualScalarRange)
+        # Share the skin geometry, the coverage array is only added to the copy
+        polyData = vtk.vtkPolyData()
+        polyData.ShallowCopy(skinPolyData)
+        self.vertexCoverage = np.zeros(polyData.GetNumberOfPoints())
+        scalars = numpy_support.numpy_to_vtk(self.vertexCoverage)
+        scalars.SetName(self.SCALARS_NAME)
+        polyData.GetPointData().AddArray(scalars)
+        self.modelNode.SetAndObservePolyData(polyData)
+        self.modelNode.SetAndObserveTransformNodeID(self.skinModel.GetTransformNodeID())
+        displayNode = self.modelNode.GetDisplayNode()
+        displayNode.SetScalarRange(0, self.targetPointsPerPatch)
+        displayNode.SetActiveScalar(self.SCALARS_NAME, vtk.vtkAssignAttribute.POINT_DATA)
+        displayNode.SetScalarVisibility(True)
+
+    def patchIndex(self, point):
+        """Return the patch of ``point``, or -1 if it is not close to the skin."""
+        i = int((point[0] - self.gridOrigin[0]) // self.lookupSpacing)
+        j = int((point[1] - self.gridOrigin[1]) // self.lookupSpacing)
+        k = int((point[2] - self.gridOrigin[2]) // self.lookupSpacing)
+        if 0 <= i < self.grid.shape[0] and 0 <= j < self.grid.shape[1] and 0 <= k < self.grid.shape[2]:
+            return self.grid[i, j, k]
+        return -1
+
+    def addPoint(self, point):
+        if self.skinModel is None:
+            return
+        patch = self.patchIndex(point)
+        if patch < 0:
+            return
+        self.hits[patch] += 1
+        self.displayOutdated = True
+        if not self.displayTimer.isActive():
+            self.displayTimer.start()
+
+    def reset(self, points=()):
+        """Clear the hit counts, then count ``points`` (e.g. the current trace)."""
+        if self.skinModel is None:
+            return
+        self.hits[:] = 0
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        cells = np.floor((points - self.gridOrigin) / self.lookupSpacing).astype(int)
+        inside = np.all((cells >= 0) & (cells < self.grid.shape), axis=1)
+        patches = self.grid[tuple(cells[inside].T)]
+        np.add.at(self.hits, patches[patches >= 0], 1)
+        self.displayOutdated = True
+        self.updateDisplay()
+
+    def updateDisplay(self):
+        self.displayTimer.stop()
+        if not self.displayOutdated or self.modelNode is None:
+            return
+        np.minimum(self.hits[self.vertexPatches], self.targetPointsPerPatch, out=self.vertexCoverage)
+        self.modelNode.GetPolyData().GetPointData().GetArray(self.SCALARS_NAME).Modified()
+        self.modelNode.GetPolyData().Modified()
+        self.displayOutdated = False
+
+    def setVisible(self, visible):
+        """Show the coverage in place of the skin model. When hidden again, the skin model is shown."""
+        if self.modelNode is None or self.skinModel is None:
+            return
+        wasVisible = self.modelNode.GetDisplayNode().GetVisibility()
+        self.updateDisplay()
+        self.modelNode.GetDisplayNode().SetVisibility(visible)
+        if visible or wasVisible:
+            self.skinModel.GetDisplayNode().SetVisibility(not visible)
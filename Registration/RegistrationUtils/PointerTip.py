@@ -0,0 +1,89 @@
+import numpy as np
+import slicer
+import vtk
+
+from slicer.util import VTKObservationMixin
+
+
+class PointerTipProvider(VTKObservationMixin):
+    """Compute the pointer tip position in world coordinates at tracker rate.
+
+    The tip is ``ParentToWorld * PointerToParent * TipToPointer * (0, 0, 0, 1)``, where only
+    ``PointerToParent`` changes with each tracker sample. ``ParentToWorld`` (the registration
+    transforms above the tracked pointer) and the tip position in the pointer frame (from the
+    pointer calibration) are cached, and invalidated when the corresponding nodes are modified.
+
+    The tracked pointer node is used rather than the calibration node, as the latter may be
+    filtered or only updated once per frame (see :class:`PoseFilterStage`).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.pointerNode = None
+        self.calibrationNode = None
+        self.parentNode = None
+        self.parentToWorldValid = False
+        self.tipValid = False
+
+        self.matrix = vtk.vtkMatrix4x4()
+        self.elements = [0.0] * 16
+        self.parentToWorld = np.eye(4)
+        self.pointerToParent = np.eye(4)
+        self.tipInPointer = np.array([0.0, 0.0, 0.0, 1.0])
+        self.tipInParent = np.zeros(4)
+        self.tipInWorld = np.zeros(4)
+
+    def setNodes(self, pointerNode, calibrationNode):
+        self.removeObservers()
+        self.pointerNode = pointerNode
+        self.calibrationNode = calibrationNode
+        self.parentNode = None
+        self.parentToWorldValid = False
+        self.tipValid = False
+        if calibrationNode is not None:
+            self.addObserver(calibrationNode, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onCalibrationModified)
+
+    def onCalibrationModified(self, caller=None, event=None):
+        self.tipValid = False
+
+    def onParentModified(self, caller=None, event=None):
+        self.parentToWorldValid = False
+
+    def updateParent(self):
+        parentNode = self.pointerNode.GetParentTransformNode()
+        if parentNode is not self.parentNode:
+            if self.parentNode is not None:
+                self.removeObserver(self.parentNode, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onParentModified)
+            self.parentNode = parentNode
+            if parentNode is not None:
+                # Also invoked when any transform above the parent is modified
+                self.addObserver(parentNode, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onParentModified)
+            self.parentToWorldValid = False
+
+        if not self.parentToWorldValid:
+            if parentNode is None:
+                self.matrix.Identity()
+            else:
+                parentNode.GetMatrixTransformToWorld(self.matrix)
+            vtk.vtkMatrix4x4.DeepCopy(self.elements, self.matrix)
+            self.parentToWorld.flat[:] = self.elements
+            self.parentToWorldValid = True
+
+    def position(self):
+        """Return the tip position in world coordinates.
+
+        The returned array is reused by the next call, copy it to keep it.
+        """
+        self.updateParent()
+        if not self.tipValid:
+            self.calibrationNode.GetMatrixTransformToParent(self.matrix)
+            for i in range(3):
+                self.tipInPointer[i] = self.matrix.GetElement(i, 3)
+            self.tipValid = True
+
+        self.pointerNode.GetMatrixTransformToParent(self.matrix)
+        vtk.vtkMatrix4x4.DeepCopy(self.elements, self.matrix)
+        self.pointerToParent.flat[:] = self.elements
+        np.dot(self.pointerToParent, self.tipInPointer, out=self.tipInParent)
+        np.dot(self.parentToWorld, self.tipInParent, out=self.tipInWorld)
+        return self.tipInWorld[:3]
@@ -0,0 +1,72 @@
+import numpy as np
+import vtk
+
+from vtk.util import numpy_support
+
+
+class SkinResiduals:
+    """Distances from points to the skin surface, computed in one call for many points.
+
+    Distances are evaluated by ``vtkImplicitPolyDataDistance`` over the whole point array at
+    once, in C++. When closest surface points are requested, the signed distances and their
+    gradients are sampled at once by ``vtkSampleImplicitFunctionFilter``, the closest point
+    of ``x`` being ``x - distance * gradient``. All queries share the cell locator of the
+    distance function, also used by :func:`distance` for single points.
+    """
+
+    def __init__(self):
+        self.distanceFunction = vtk.vtkImplicitPolyDataDistance()
+        self.values = vtk.vtkDoubleArray()
+        self.pointSet = vtk.vtkPolyData()
+        self.pointSet.SetPoints(vtk.vtkPoints())
+        self.sampler = vtk.vtkSampleImplicitFunctionFilter()
+        self.sampler.SetImplicitFunction(self.distanceFunction)
+        self.sampler.ComputeGradientsOn()
+        self.sampler.SetInputData(self.pointSet)
+
+    def setSurface(self, polyData):
+        self.distanceFunction.SetInput(polyData)
+
+    def distance(self, point):
+        """Return the distance of ``point`` to the surface."""
+        return abs(self.distanceFunction.EvaluateFunction(point))
+
+    def compute(self, points, closestPoints=False):
+        """Return the distances of the N x 3 ``points`` to the surface, as a N array.
+
+        If ``closestPoints`` is True, also return the closest surface points as a N x 3 array.
+        """
+        points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+        if len(points) == 0:
+            return (np.zeros(0), np.zeros((0, 3))) if closestPoints else np.zeros(0)
+
+        if not closestPoints:
+            self.distanceFunction.FunctionValue(numpy_support.numpy_to_vtk(points), self.values)
+            return np.abs(numpy_support.vtk_to_numpy(self.values))
+
+        # The point set shares the memory of points, which outlives the update
+        self.pointSet.GetPoints().SetData(numpy_support.numpy_to_vtk(points))
+        self.pointSet.Modified()
+        self.sampler.Update()
+        pointData = self.sampler.GetOutput().GetPointData()
+        values = numpy_support.vtk_to_numpy(pointData.GetArray(self.sampler.GetScalarArrayName()))
+        gradients = numpy_support.vtk_to_numpy(pointData.GetArray(self.sampler.GetGradientArrayName()))
+        closest = points - values[:, np.newaxis] * gradients
+        return np.abs(values), closest
+
+
+def residualStatistics(distances, percentiles=(90, 95)):
+    """Return the mean, median, RMS, maximum and ``percentiles`` (e.g. ``p95``) of ``distances``."""
+    distances = np.asarray(distances, dtype=float)
+    if len(distances) == 0:
+        return {"count": 0}
+    statistics = {
+        "count": len(distances),
+        "mean": float(np.mean(distances)),
+        "median": float(np.median(distances)),
+        "rms": float(np.sqrt(np.mean(np.square(distances)))),
+        "max": float(np.max(distances)),
+    }
+    for percentile, value in zip(percentiles, np.percentile(distances, percentiles), strict=True):
+        statistics[f"p{percentile}"] = float(value)
+    return statistics
@@ -0,0 +1,138 @@
+import bisect
+import collections
+import time
+
+import numpy as np
+
+
+class ToolStatistics:
+    """Rolling update-rate, jitter and dropout statistics of a tracked tool transform.
+
+    :func:`addSample` is meant to be called for every transform update and only does
+    constant-time bookkeeping, the median of :attr:`BASELINE_SAMPLES` intervals included. Rates and percentiles are computed on demand by
+    :func:`summary`.
+    """
+
+    # Inter-arrival intervals kept to compute rate, interval and jitter percentiles
+    WINDOW_SEC = 5.0
+    MAX_SAMPLES = 5000
+
+    # A gap longer than this factor times the expected interval is counted as a dropout
+    DROPOUT_INTERVAL_FACTOR = 2.5
+
+    # The expected interval is the median of this many last intervals, dropouts included, so
+    # that it follows a tracker rate change within a few samples and ignores isolated bursts
+    BASELINE_SAMPLES = 31
+
+    # Upper edges (seconds) of the dropout-gap histogram bins, the last bin is open ended
+    DROPOUT_BIN_EDGES = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+
+    # Percentiles of the inter-arrival intervals, and of their deviation from the median interval (jitter)
+    JITTER_PERCENTILES = (50, 95, 99)
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.sampleCount = 0
+        self.firstSampleTime = None
+        self.lastSampleTime = None
+        self.expectedInterval = None  # median of the last BASELINE_SAMPLES intervals
+        self.recentIntervals = np.zeros(self.BASELINE_SAMPLES)
+        self.recentIntervalCount = 0
+        self.intervals = collections.deque(maxlen=self.MAX_SAMPLES)
+        self.intervalTimes = collections.deque(maxlen=self.MAX_SAMPLES)
+        self.dropoutCount = 0
+        self.dropoutHistogram = [0] * (len(self.DROPOUT_BIN_EDGES) + 1)
+        self.lostTime = 0.0
+
+    def addSample(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        self.sampleCount += 1
+        if self.lastSampleTime is None:
+            if self.firstSampleTime is None:
+                self.firstSampleTime = timestamp
+            self.lastSampleTime = timestamp
+            return
+
+        interval = timestamp - self.lastSampleTime
+        self.lastSampleTime = timestamp
+
+        dropout = self.isDropout(interval)
+        self.recentIntervals[self.recentIntervalCount % self.BASELINE_SAMPLES] = interval
+        self.recentIntervalCount += 1
+        self.expectedInterval = float(np.median(self.recentIntervals[: min(self.recentIntervalCount, self.BASELINE_SAMPLES)]))
+
+        if dropout:
+            self.dropoutCount += 1
+            self.dropoutHistogram[bisect.bisect_left(self.DROPOUT_BIN_EDGES, interval)] += 1
+            self.lostTime += interval
+            return
+
+        self.intervals.append(interval)
+        self.intervalTimes.append(timestamp)
+
+    def pause(self):
+        """Stop accounting until the next sample, e.g. while the tool is not observed.
+
+        The time until the next sample is neither an interval nor a dropout.
+        """
+        self.lastSampleTime = None
+
+    def isDropout(self, interval):
+        if self.expectedInterval is None:
+            return False
+        return interval > self.DROPOUT_INTERVAL_FACTOR * self.expectedInterval
+
+    def currentGap(self, now=None):
+        """Return the duration of the ongoing dropout, or 0 if the tool is updating."""
+        if self.lastSampleTime is None:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        gap = now - self.lastSampleTime
+        return gap if self.isDropout(gap) else 0.0
+
+    def summary(self, now=None):
+        """Return a dictionary summarizing the statistics of the last :attr:`WINDOW_SEC` seconds.
+
+        Rate is in Hz. Interval percentiles are inter-arrival intervals and jitter percentiles
+        are deviations of the intervals from their median, both in milliseconds. Lost time is
+        the total duration of the completed dropouts and current gap the duration of the
+        ongoing one, both in seconds.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        while self.intervalTimes and now - self.intervalTimes[0] > self.WINDOW_SEC:
+            self.intervalTimes.popleft()
+            self.intervals.popleft()
+
+        rate = 0.0
+        interval = dict.fromkeys(self.JITTER_PERCENTILES, 0.0)
+        jitter = dict.fromkeys(self.JITTER_PERCENTILES, 0.0)
+        if self.intervals:
+            intervals = np.fromiter(self.intervals, dtype=float, count=len(self.intervals))
+            meanInterval = float(intervals.mean())
+            rate = 1.0 / meanInterval if meanInterval > 0 else 0.0
+            deviations = np.abs(intervals - np.median(intervals))
+            interval = dict(zip(self.JITTER_PERCENTILES, (np.percentile(intervals, self.JITTER_PERCENTILES) * 1000.0).tolist(), strict=True))
+            jitter = dict(zip(self.JITTER_PERCENTILES, (np.percentile(deviations, self.JITTER_PERCENTILES) * 1000.0).tolist(), strict=True))
+
+        if self.currentGap(now) > 0:
+            rate = 0.0
+
+        return {
+            "name": self.name,
+            "samples": self.sampleCount,
+            "rate": rate,
+            "interval": interval,
+            "jitter": jitter,
+            "dropouts": self.dropoutCount,
+            "dropoutHistogram": dict(zip([*self.DROPOUT_BIN_EDGES, float("inf")], self.dropoutHistogram, strict=True)),
+            "lostTime": self.lostTime,
+            "currentGap": self.currentGap(now),
+        }
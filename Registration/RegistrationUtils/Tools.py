@@ -1,8 +1,18 @@
+import time
+
 from enum import Enum
+
 import qt
 import slicer
 import vtk
 
+from slicer.util import VTKObservationMixin
+
+from OptiTrackUtils import Metric
+
+from .PoseFilter import PoseFilterStage
+from .ToolStatistics import ToolStatistics
+
 
 class ToolState(Enum):
     NEVER_SEEN = 0
@@ -15,118 +25,247 @@ class Tool:
         self.id = ID  # {Name}ToTracker transform
         self.name = name
         self.displayGeometry = displayGeometry
+        # The marker follows a copy of the tool transform updated at most once per rendered frame
+        self.displayStage = PoseFilterStage(f"{ID}Display") if displayGeometry else None
         self.state = ToolState.NEVER_SEEN
-        self.xposition = None
+        self.node = None
+        self.lastUpdateTime = None  # time.monotonic() of the last transform update
+        self.statistics = ToolStatistics(name)
+
+        # Row of the tool in the seen/unseen tables and last state applied to the display
+        self.row = None
+        self.displayedSeen = None
+        self.displayedMarkerVisible = None
 
 
-class Tools:
-    def __init__(self, seenTableWidget, unseenTableWidget, moduleName):
+class Tools(VTKObservationMixin):
+    # Time without a transform update after which a tool is reported as not seen.
+    # PlusServer only sends valid transforms, so a tool out of view stops updating.
+    DEFAULT_STALE_TIMEOUT_SEC = 0.25
+
+    STATISTICS_DISPLAY_INTERVAL_MS = 1000
+
+    def __init__(self, seenTableWidget, unseenTableWidget, moduleName, statisticsTableWidget=None):
+        super().__init__()
         self.tools = []
         self.moduleName = moduleName
         self.seenTableWidget = seenTableWidget
         self.unseenTableWidget = unseenTableWidget
+        self.statisticsTableWidget = statisticsTableWidget
         self.optitrack = None
         self.showToolMarkers = False
+        self.staleTimeout = self.DEFAULT_STALE_TIMEOUT_SEC
+
+        self.pointerModel = None
+        self.displayedAnyUnseen = None
+
+        for table in [self.seenTableWidget, self.unseenTableWidget]:
+            table.setShowGrid(False)
+            table.setFocusPolicy(qt.Qt.NoFocus)
+            table.setSelectionMode(qt.QAbstractItemView.NoSelection)
+            table.setFrameStyle(qt.QFrame.NoFrame)
 
         self.checkToolsTimer = qt.QTimer()
-        self.checkToolsTimer.interval = 100
         self.checkToolsTimer.timeout.connect(self.checkTools)
+        self.setStaleTimeout(self.DEFAULT_STALE_TIMEOUT_SEC)
+
+        self.statisticsTimer = qt.QTimer()
+        self.statisticsTimer.interval = self.STATISTICS_DISPLAY_INTERVAL_MS
+        self.statisticsTimer.timeout.connect(self.updateStatisticsDisplay)
 
     def addTool(self, ID, name, geometry=None):
         newTool = Tool(ID, name, geometry)
         self.tools.append(newTool)
+        newTool.row = self.addToolToTable(newTool, self.seenTableWidget)
+        self.addToolToTable(newTool, self.unseenTableWidget)
+        if self.checkToolsTimer.isActive():
+            self.observeTool(newTool)
         self.updateToolsDisplay()
 
+    def setStaleTimeout(self, seconds):
+        """Set the time without transform update after which a tool is reported as not seen.
+
+        Staleness is checked twice per timeout period, so a lost tool is reported
+        at most 1.5 timeout after its last update.
+        """
+        self.staleTimeout = seconds
+        self.checkToolsTimer.interval = max(1, int(seconds * 1000 / 2))
+
     def setToolsStatusCheckEnabled(self, enabled):
-        """Check the status of the tracking tool every 100ms and
-        update the table summarizing the status of each tools.
+        """Observe the tracking tool transforms and update the table summarizing
+        the status of each tools.
+
+        Each ``TransformModifiedEvent`` of a ``{Name}ToTracker`` node timestamps the
+        tool as seen. A timer then reports tools whose last update is older than
+        :attr:`staleTimeout` as not seen.
 
-        See :func:`RegistrationUtils.Tools.checkTools`
+        See :func:`RegistrationUtils.Tools.onToolTransformModified`,
+        :func:`RegistrationUtils.Tools.checkTools`
         and :func:`RegistrationUtils.Tools.updateToolsDisplay()`.
         """
         if enabled:
+            self.observeTools()
             # If timer is already started, it will stop and restart it.
             self.checkToolsTimer.start()
+            if self.statisticsTableWidget is not None:
+                self.statisticsTimer.start()
         else:
             self.checkToolsTimer.stop()
+            self.statisticsTimer.stop()
+            self.removeObservers()
+            for tool in self.tools:
+                tool.node = None
+                if tool.displayStage:
+                    tool.displayStage.setInputNode(None)
+                # Updates are not observed anymore, this is not a dropout
+                tool.statistics.pause()
 
-    def checkTools(self):
-        if self.optitrack is None:
-            print("Fail")
+    def observeTools(self):
+        self.removeObservers()
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+        self.addObserver(slicer.mrmlScene, slicer.vtkMRMLScene.NodeAboutToBeRemovedEvent, self.onNodeAboutToBeRemoved)
+        for tool in self.tools:
+            self.observeTool(tool)
+
+    def observeTool(self, tool, node=None):
+        if node is None:
+            node = self.optitrack.nodeRegistry.node(tool.id) if self.optitrack is not None else slicer.mrmlScene.GetFirstNodeByName(tool.id)
+        if node is None or node is tool.node:
             return
 
+        if self.optitrack is not None:
+            self.optitrack.nodeRegistry.prepare(node)
+
+        tool.node = node
+        self.addObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onToolTransformModified)
+        if tool.displayStage:
+            tool.displayStage.setInputNode(node)
+            tool.displayGeometry.SetAndObserveTransformNodeID(tool.displayStage.outputNode.GetID())
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, caller, event, calldata):
+        node = calldata
+        if not isinstance(node, slicer.vtkMRMLTransformNode):
+            return
         for tool in self.tools:
-            if not self.optitrack.checkNode(tool.id):
+            if tool.id == node.GetName():
+                self.observeTool(tool, node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAboutToBeRemoved(self, caller, event, calldata):
+        node = calldata
+        for tool in self.tools:
+            if tool.node is node:
+                self.removeObserver(node, slicer.vtkMRMLTransformNode.TransformModifiedEvent, self.onToolTransformModified)
+                tool.node = None
+                if tool.displayStage:
+                    tool.displayStage.setInputNode(None)
+                tool.lastUpdateTime = None
                 tool.state = ToolState.NEVER_SEEN
-                break
+                self.updateToolsDisplay()
+
+    def onToolTransformModified(self, caller, event):
+        now = time.monotonic()
+        stateChanged = False
+        for tool in self.tools:
+            if tool.node is caller:
+                tool.lastUpdateTime = now
+                tool.statistics.addSample(now)
+                if tool.state != ToolState.SEEN:
+                    tool.state = ToolState.SEEN
+                    stateChanged = True
 
-            self.checkIfNodeIsActive(tool)
+        # Report a reappearing tool immediately rather than on the next timer tick
+        if stateChanged:
+            self.updateToolsDisplay()
 
-        self.updateToolsDisplay()
+    def getToolStatistics(self):
+        """Return the update-rate and dropout statistics of each tool, keyed by tool name.
 
-    def checkIfNodeIsActive(self, tool):
-        try:
-            node = slicer.util.getNode(tool.id)
-            matrix = vtk.vtkMatrix4x4()
-            node.GetMatrixTransformToParent(matrix)
-            xposition = matrix.GetElement(0, 3)
+        See :func:`RegistrationUtils.ToolStatistics.summary`.
+        """
+        now = time.monotonic()
+        return {tool.name: tool.statistics.summary(now) for tool in self.tools}
 
-            # if position, then tool is current
+    def collectMetrics(self):
+        """Return the per-tool update rate, jitter and dropout metrics, see :class:`OptiTrackUtils.MetricsExporter`."""
+        rate = Metric("opennav_tool_update_rate_hz", "gauge", "Tool transform update rate over the statistics window.")
+        interval = Metric("opennav_tool_update_interval_seconds", "gauge", "Tool transform inter-arrival interval percentiles.")
+        jitter = Metric("opennav_tool_update_jitter_seconds", "gauge", "Tool transform inter-arrival interval deviation from the median interval, percentiles.")
+        samples = Metric("opennav_tool_updates_total", "counter", "Tool transform updates received.")
+        dropouts = Metric("opennav_tool_dropouts_total", "counter", "Tool tracking dropouts.")
+        dropoutDuration = Metric("opennav_tool_dropout_duration_seconds", "histogram", "Duration of completed tool tracking dropouts.")
+        currentGap = Metric("opennav_tool_current_dropout_seconds", "gauge", "Duration of the ongoing tool tracking dropout, 0 if the tool is updating.")
+        for name, summary in self.getToolStatistics().items():
+            rate.add(summary["rate"], tool=name)
+            for percentile, value in summary["interval"].items():
+                interval.add(value / 1000.0, tool=name, quantile=percentile / 100.0)
+            for percentile, value in summary["jitter"].items():
+                jitter.add(value / 1000.0, tool=name, quantile=percentile / 100.0)
+            samples.add(summary["samples"], tool=name)
+            dropouts.add(summary["dropouts"], tool=name)
+            cumulativeCount = 0
+            for edge, count in summary["dropoutHistogram"].items():
+                cumulativeCount += count
+                dropoutDuration.add(cumulativeCount, suffix="_bucket", tool=name, le=edge)
+            dropoutDuration.add(cumulativeCount, suffix="_count", tool=name)
+            dropoutDuration.add(summary["lostTime"], suffix="_sum", tool=name)
+            currentGap.add(summary["currentGap"], tool=name)
+        return [rate, interval, jitter, samples, dropouts, dropoutDuration, currentGap]
 
-            if tool.xposition is None:
-                tool.state = ToolState.SEEN
+    def resetToolStatistics(self):
+        for tool in self.tools:
+            tool.statistics.reset()
+
+    def checkTools(self):
+        now = time.monotonic()
+        for tool in self.tools:
+            if tool.lastUpdateTime is None:
+                tool.state = ToolState.NEVER_SEEN
+            elif now - tool.lastUpdateTime > self.staleTimeout:
+                tool.state = ToolState.NOT_SEEN
             else:
-                # has position updated since last time?
-                if tool.xposition == xposition:
-                    tool.state = ToolState.NOT_SEEN
-                else:
-                    tool.state = ToolState.SEEN
+                tool.state = ToolState.SEEN
 
-            # Update position
-            tool.xposition = xposition
+        self.updateToolsDisplay()
 
-            if tool.displayGeometry:
-                tool.displayGeometry.SetAndObserveTransformNodeID(node.GetID())
-        except:
-            print("Fail")
-            pass
+    def getPointerModel(self):
+        if self.pointerModel is None or self.pointerModel.GetScene() is None:
+            self.pointerModel = slicer.util.getFirstNodeByName("NEEDLE_MODEL")
+            self.displayedAnyUnseen = None
+        return self.pointerModel
 
     def updateToolsDisplay(self):
-        self.seenTableWidget.setRowCount(0)
-        self.unseenTableWidget.setRowCount(0)
+        """Update the tool tables, tool markers and pointer color.
 
+        Each tool has a persistent row in both tables, shown in the one matching its state.
+        Only the elements whose state changed since the last call are updated.
+        """
         anyUnseen = False
         for tool in self.tools:
-            if tool.state == ToolState.SEEN:
-                self.addToolToTable(tool, self.seenTableWidget)
-                if tool.displayGeometry:
-                    tool.displayGeometry.GetDisplayNode().SetVisibility(self.showToolMarkers)
-            else:
-                anyUnseen = True
-                self.addToolToTable(tool, self.unseenTableWidget)
-                if tool.displayGeometry:
-                    tool.displayGeometry.GetDisplayNode().SetVisibility(False)
+            seen = tool.state == ToolState.SEEN
+            anyUnseen = anyUnseen or not seen
 
-        pointerModel = slicer.util.getFirstNodeByName("NEEDLE_MODEL")
+            if seen != tool.displayedSeen:
+                self.seenTableWidget.setRowHidden(tool.row, not seen)
+                self.unseenTableWidget.setRowHidden(tool.row, seen)
+                tool.displayedSeen = seen
+
+            markerVisible = seen and self.showToolMarkers
+            if tool.displayGeometry and markerVisible != tool.displayedMarkerVisible:
+                tool.displayGeometry.GetDisplayNode().SetVisibility(markerVisible)
+                tool.displayedMarkerVisible = markerVisible
+
+        pointerModel = self.getPointerModel()
         if not pointerModel:
             print("Pointer missing!!")
             return
-        if anyUnseen:
-            pointerModel.GetDisplayNode().SetColor(220, 0, 0)
-        else:
-            pointerModel.GetDisplayNode().SetColor(220, 220, 0)
-
-        self.seenTableWidget.resizeColumnToContents(0)
-        self.seenTableWidget.setShowGrid(False)
-        self.seenTableWidget.setFocusPolicy(qt.Qt.NoFocus)
-        self.seenTableWidget.setSelectionMode(qt.QAbstractItemView.NoSelection)
-        self.seenTableWidget.setFrameStyle(qt.QFrame.NoFrame)
-
-        self.unseenTableWidget.resizeColumnToContents(0)
-        self.unseenTableWidget.setShowGrid(False)
-        self.unseenTableWidget.setFocusPolicy(qt.Qt.NoFocus)
-        self.unseenTableWidget.setSelectionMode(qt.QAbstractItemView.NoSelection)
-        self.unseenTableWidget.setFrameStyle(qt.QFrame.NoFrame)
+        if anyUnseen != self.displayedAnyUnseen:
+            if anyUnseen:
+                pointerModel.GetDisplayNode().SetColor(220, 0, 0)
+            else:
+                pointerModel.GetDisplayNode().SetColor(220, 220, 0)
+            self.displayedAnyUnseen = anyUnseen
 
     def addToolToTable(self, tool, table):
         row = table.rowCount
@@ -134,3 +273,28 @@ class Tools:
         nameLabel = qt.QLabel(tool.name)
         nameLabel.setAlignment(qt.Qt.AlignVCenter)
         table.setCellWidget(row, 0, nameLabel)
+        table.setRowHidden(row, True)
+        table.resizeColumnToContents(0)
+        return row
+
+    def updateStatisticsDisplay(self):
+        table = self.statisticsTableWidget
+        if table is None:
+            return
+
+        statistics = self.getToolStatistics()
+        table.setRowCount(len(statistics))
+        for row, summary in enumerate(statistics.values()):
+            values = [
+                summary["name"],
+                f"{summary['rate']:.1f}",
+                f"{summary['jitter'][95]:.1f}",
+                str(summary["dropouts"]),
+                f"{summary['lostTime'] + summary['currentGap']:.1f}",
+            ]
+            for column, value in enumerate(values):
+                item = table.item(row, column)
+                if item is None:
+                    item = qt.QTableWidgetItem()
+                    table.setItem(row, column, item)
+                item.setText(value)
@@ -1,6 +1,11 @@
 from enum import Enum
 
+import numpy as np
+import qt
 import slicer
+import vtk
+
+from vtk.util import numpy_support
 
 
 class TracingState(Enum):
@@ -10,35 +15,191 @@ class TracingState(Enum):
 
 
 class Trace:
+    """Points traced on the patient skin with the pointer, for surface registration.
+
+    Points are stored in a preallocated NumPy buffer, grown by doubling, so that adding
+    a point at tracker rate does not touch the scene. The ``Trace`` model node displays
+    the points as vertices: its polydata shares the buffer memory, so a display update
+    only marks the arrays modified, at most every :attr:`DISPLAY_UPDATE_INTERVAL_MS` or
+    on demand with :func:`updateDisplay`. Points may be colored by a per-point scalar,
+    e.g. the distance to the skin, with :func:`setScalars`.
+
+    Each acquisition (:func:`startAcquisition`) is a contiguous range of the buffer, so it
+    is undone by truncating the point count, and redone by restoring it as long as no point
+    was added since. Points added before the first acquisition, e.g. landmarks, are kept.
+
+    Point coordinates are in the parent space of :attr:`modelNode`, see :func:`worldPoints`.
+    """
+
+    INITIAL_CAPACITY = 4096
+    DISPLAY_UPDATE_INTERVAL_MS = 100
+    POINT_SIZE = 6
+    SCALARS_NAME = "Residual"
+
     def __init__(self):
         self.state = TracingState.NOT_STARTED
-        self.traceNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "Trace")
-        self.traceNode.GetMarkupsDisplayNode().SetVisibility(False)
-        self.traceNode.GetMarkupsDisplayNode().SetVisibility2D(False)
-        self.traceNode.GetMarkupsDisplayNode().SetSelectedColor(90 / 255.0, 194 / 255.0, 201 / 255.0)
-        self.traceNode.GetMarkupsDisplayNode().SetColor(72 / 255.0, 72 / 255.0, 72 / 255.0)
-        self.traceNode.GetMarkupsDisplayNode().SetTextScale(0)
-        self.traceNode.GetMarkupsDisplayNode().SetUseGlyphScale(False)
-        self.traceNode.GetMarkupsDisplayNode().SetGlyphSize(6)
-        self.traceNode.SetLocked(True)
-        self.traceNode.SaveWithSceneOff()
+        self.buffer = np.zeros((self.INITIAL_CAPACITY, 3))
+        self.count = 0
+        self.displayOutdated = False
         self.initialized_with_landmarks = False
-        self.lastAcquisitionLength = 0
+        # [start, end) buffer ranges of the acquisitions, and of the undone acquisitions, last undone last
+        self.acquisitions = []
+        self.undoneAcquisitions = []
+
+        self.polyData = vtk.vtkPolyData()
+        self.polyData.SetPoints(vtk.vtkPoints())
+        self.polyData.SetVerts(vtk.vtkCellArray())
+        self.modelNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode", "Trace")
+        self.modelNode.SetAndObservePolyData(self.polyData)
+        self.modelNode.SaveWithSceneOff()
+        self.modelNode.CreateDefaultDisplayNodes()
+        displayNode = self.modelNode.GetDisplayNode()
+        displayNode.SetRepresentation(slicer.vtkMRMLDisplayNode.PointsRepresentation)
+        displayNode.SetPointSize(self.POINT_SIZE)
+        displayNode.SetColor(90 / 255.0, 194 / 255.0, 201 / 255.0)
+        displayNode.SetVisibility(False)
+        displayNode.SetVisibility2D(False)
+        displayNode.SetAndObserveColorNodeID("vtkMRMLColorTableNodeFileColdToHotRainbow.txt")
+        displayNode.SetScalarRangeFlag(slicer.vtkMRMLDisplayNode.UseManualScalarRange)
+
+        self.displayTimer = qt.QTimer()
+        self.displayTimer.singleShot = True
+        self.displayTimer.interval = self.DISPLAY_UPDATE_INTERVAL_MS
+        self.displayTimer.timeout.connect(self.updateDisplay)
+
+    @property
+    def numberOfPoints(self):
+        return self.count
+
+    @property
+    def points(self):
+        """Traced points as a N x 3 array view, valid until the next modification."""
+        return self.buffer[: self.count]
+
+    @property
+    def lastAcquisitionLength(self):
+        if not self.acquisitions:
+            return 0
+        start, end = self.acquisitions[-1]
+        return end - start
+
+    @property
+    def canUndo(self):
+        return any(end > start for start, end in self.acquisitions)
+
+    @property
+    def canRedo(self):
+        return bool(self.undoneAcquisitions)
+
+    def startAcquisition(self):
+        """Start a new acquisition: points added from now on are undone together."""
+        if self.acquisitions and self.lastAcquisitionLength == 0:
+            return
+        self.acquisitions.append([self.count, self.count])
 
     def addPoint(self, point):
-        self.traceNode.AddControlPoint(point[0], point[1], point[2])
-        self.lastAcquisitionLength += 1
+        if self.count == len(self.buffer):
+            self.buffer = np.concatenate((self.buffer, np.zeros_like(self.buffer)))
+        self.buffer[self.count] = point
+        self.count += 1
+        if self.acquisitions:
+            self.acquisitions[-1][1] = self.count
+        # The undone points are being overwritten
+        self.undoneAcquisitions = []
+        self.pointsModified()
 
     def clearTrace(self):
         self.state = TracingState.NOT_STARTED
-        self.traceNode.RemoveAllControlPoints()
+        self.count = 0
         self.initialized_with_landmarks = False
-        self.lastAcquisitionLength = 0
+        self.acquisitions = []
+        self.undoneAcquisitions = []
+        self.pointsModified()
+        self.updateDisplay()
+
+    def undoAcquisition(self):
+        """Remove the points of the last acquisition. Return False if there is none."""
+        while self.acquisitions and self.lastAcquisitionLength == 0:
+            self.acquisitions.pop()
+        if not self.acquisitions:
+            return False
+        acquisition = self.acquisitions.pop()
+        self.undoneAcquisitions.append(acquisition)
+        self.count = acquisition[0]
+        self.pointsModified()
+        self.updateDisplay()
+        return True
+
+    def redoAcquisition(self):
+        """Restore the points of the last undone acquisition. Return False if there is none."""
+        if not self.undoneAcquisitions:
+            return False
+        acquisition = self.undoneAcquisitions.pop()
+        self.acquisitions.append(acquisition)
+        self.count = acquisition[1]
+        self.pointsModified()
+        self.updateDisplay()
+        return True
 
     def discardLastAcquisition(self):
-        for _ in range(self.lastAcquisitionLength):
-            self.traceNode.RemoveMarkup(self.traceNode.GetNumberOfMarkups() - 1)
-        self.lastAcquisitionLength = 0
+        self.undoAcquisition()
+
+    def pointsModified(self):
+        self.displayOutdated = True
+        if not self.displayTimer.isActive():
+            self.displayTimer.start()
+
+    def updateDisplay(self):
+        """Update the displayed points with the traced points."""
+        self.displayTimer.stop()
+        if not self.displayOutdated:
+            return
+        # Share the buffer memory rather than copying the points, the arrays keep a reference to it
+        self.polyData.GetPoints().SetData(numpy_support.numpy_to_vtk(self.points))
+        ids = np.arange(self.count, dtype=numpy_support.ID_TYPE_CODE)
+        offsets = np.arange(self.count + 1, dtype=numpy_support.ID_TYPE_CODE)
+        self.polyData.GetVerts().SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets), numpy_support.numpy_to_vtkIdTypeArray(ids))
+        # Scalars no longer match the points
+        self.polyData.GetPointData().RemoveArray(self.SCALARS_NAME)
+        self.modelNode.GetDisplayNode().SetScalarVisibility(False)
+        self.polyData.Modified()
+        self.displayOutdated = False
+
+    def setScalars(self, values, scalarRange=None):
+        """Color the traced points by ``values``, one per point, e.g. their distance to the skin in mm.
+
+        Colors are reset when points are added or removed.
+        """
+        self.updateDisplay()
+        scalars = numpy_support.numpy_to_vtk(np.asarray(values, dtype=float), deep=True)
+        scalars.SetName(self.SCALARS_NAME)
+        self.polyData.GetPointData().AddArray(scalars)
+        displayNode = self.modelNode.GetDisplayNode()
+        if scalarRange is None:
+            scalarRange = scalars.GetRange()
+        displayNode.SetScalarRange(*scalarRange)
+        displayNode.SetActiveScalar(self.SCALARS_NAME, vtk.vtkAssignAttribute.POINT_DATA)
+        displayNode.SetScalarVisibility(True)
+        self.polyData.Modified()
+
+    def toMarkups(self, name="Trace"):
+        """Return a new markups fiducial node holding the traced points, e.g. to save or edit them."""
+        markupsNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", name)
+        slicer.util.updateMarkupsControlPointsFromArray(markupsNode, self.points)
+        markupsNode.SetAndObserveTransformNodeID(self.modelNode.GetTransformNodeID())
+        return markupsNode
+
+    def setAndObserveTransformNodeID(self, transformNodeID):
+        self.modelNode.SetAndObserveTransformNodeID(transformNodeID)
+
+    def worldPoints(self):
+        """Return the traced points transformed to world coordinates, as a new N x 3 array."""
+        parentToWorld = vtk.vtkMatrix4x4()
+        parentTransformNode = self.modelNode.GetParentTransformNode()
+        if parentTransformNode is not None:
+            parentTransformNode.GetMatrixTransformToWorld(parentToWorld)
+        matrix = slicer.util.arrayFromVTKMatrix(parentToWorld)
+        return self.points @ matrix[:3, :3].T + matrix[:3, 3]
 
     def setVisible(self, visible):
-        self.traceNode.GetMarkupsDisplayNode().SetVisibility(visible)
+        self.modelNode.GetDisplayNode().SetVisibility(visible)
@@ -0,0 +1,151 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+# Trace archive file layout:
+#   - a fixed-size header: magic, then the JSON metadata padded with spaces
+#   - one block per acquisition, appended when the acquisition ends: a block header with the
+#     number of samples and the landmark registration in effect, followed by the samples
+TRACE_ARCHIVE_MAGIC = b"OPENNAVTRC\x00\x01"
+TRACE_ARCHIVE_HEADER_SIZE = 4096
+TRACE_ARCHIVE_BLOCK_DTYPE = np.dtype(
+    [
+        ("acquisition", "<u4"),  # index of the acquisition in the file
+        ("sampleCount", "<u4"),
+        ("landmarkTransform", "<f8", (4, 4)),  # row-major landmark registration transform to parent
+    ],
+)
+TRACE_ARCHIVE_SAMPLE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),  # seconds since epoch
+        ("point", "<f4", (3,)),  # pointer tip, in the trace coordinates
+        ("accepted", "u1"),  # 1 if the sample was added to the trace
+    ],
+)
+
+
+def readTraceArchive(path):
+    """Read a trace archive file.
+
+    Return the metadata and a list of acquisitions, each a dictionary with the ``acquisition``
+    index, the ``landmarkTransform`` 4x4 array and the ``samples`` structured array with
+    ``timestamp``, ``point`` and ``accepted`` fields.
+
+    >>> metadata, acquisitions = readTraceArchive(path)
+    >>> points = np.concatenate([a["samples"]["point"][a["samples"]["accepted"] == 1] for a in acquisitions])
+    """
+    with open(path, "rb") as fh:
+        header = fh.read(TRACE_ARCHIVE_HEADER_SIZE)
+        if not header.startswith(TRACE_ARCHIVE_MAGIC):
+            raise ValueError(f"{path} is not a trace archive file")
+        metadata = json.loads(header[len(TRACE_ARCHIVE_MAGIC) :].decode("utf-8"))
+        data = fh.read()
+
+    acquisitions = []
+    offset = 0
+    while offset + TRACE_ARCHIVE_BLOCK_DTYPE.itemsize <= len(data):
+        block = np.frombuffer(data, dtype=TRACE_ARCHIVE_BLOCK_DTYPE, count=1, offset=offset)[0]
+        offset += TRACE_ARCHIVE_BLOCK_DTYPE.itemsize
+        sampleCount = int(block["sampleCount"])
+        if offset + sampleCount * TRACE_ARCHIVE_SAMPLE_DTYPE.itemsize > len(data):
+            # Truncated last block, e.g. if the application exited while writing
+            break
+        samples = np.frombuffer(data, dtype=TRACE_ARCHIVE_SAMPLE_DTYPE, count=sampleCount, offset=offset)
+        offset += sampleCount * TRACE_ARCHIVE_SAMPLE_DTYPE.itemsize
+        acquisitions.append({"acquisition": int(block["acquisition"]), "landmarkTransform": np.array(block["landmarkTransform"]), "samples": samples})
+    return metadata, acquisitions
+
+
+class TraceArchive:
+    """Archive every pointer sample of the surface tracing acquisitions to a file.
+
+    Samples, rejected ones included, are copied in a preallocated buffer during an acquisition.
+    When the acquisition ends, its block is queued to a writer thread that appends it to the
+    file, so that tracing never waits for the disk. See :func:`readTraceArchive` to load an archive.
+    """
+
+    INITIAL_CAPACITY = 4096
+
+    def __init__(self):
+        self.path = None
+        self.queue = None
+        self.thread = None
+        self.acquisitionCount = 0
+        self.acquiring = False
+        self.block = np.zeros(1, dtype=TRACE_ARCHIVE_BLOCK_DTYPE)
+        self.samples = np.zeros(self.INITIAL_CAPACITY, dtype=TRACE_ARCHIVE_SAMPLE_DTYPE)
+        self.sampleCount = 0
+
+    @property
+    def isOpen(self):
+        return self.thread is not None
+
+    def open(self, path, metadata=None):
+        """Start a new archive at ``path``. ``metadata`` is saved as JSON in the file header."""
+        self.close()
+        metadata = json.dumps({"version": 1, **(metadata or {})}).encode("utf-8")
+        header = TRACE_ARCHIVE_MAGIC + metadata
+        if len(header) > TRACE_ARCHIVE_HEADER_SIZE:
+            raise ValueError("Trace archive metadata is too large")
+        self.path = path
+        self.acquisitionCount = 0
+        self.queue = queue.Queue()
+        self.queue.put(header.ljust(TRACE_ARCHIVE_HEADER_SIZE, b" "))
+        self.thread = threading.Thread(target=self.writeBlocks, args=(path, self.queue), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if not self.isOpen:
+            return
+        self.endAcquisition()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.queue = None
+        print(f"Trace archive saved: {self.acquisitionCount} acquisitions in {self.path}")
+
+    def startAcquisition(self, landmarkTransform):
+        """Start archiving an acquisition, ``landmarkTransform`` being the 16 elements of the landmark registration matrix."""
+        self.endAcquisition()
+        self.block["acquisition"] = self.acquisitionCount
+        self.block["landmarkTransform"] = np.reshape(landmarkTransform, (1, 4, 4))
+        self.sampleCount = 0
+        self.acquiring = True
+
+    def addSample(self, point, timestamp, accepted):
+        if not self.acquiring:
+            return
+        if self.sampleCount == len(self.samples):
+            self.samples = np.concatenate((self.samples, np.zeros_like(self.samples)))
+        sample = self.samples[self.sampleCount]
+        sample["timestamp"] = timestamp
+        sample["point"] = point
+        sample["accepted"] = accepted
+        self.sampleCount += 1
+
+    def endAcquisition(self):
+        if not self.acquiring:
+            return
+        self.acquiring = False
+        if not self.isOpen or self.sampleCount == 0:
+            return
+        self.block["sampleCount"] = self.sampleCount
+        self.queue.put(self.block.tobytes() + self.samples[: self.sampleCount].tobytes())
+        self.acquisitionCount += 1
+
+    @staticmethod
+    def writeBlocks(path, blocks):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as fh:
+                while (data := blocks.get()) is not None:
+                    fh.write(data)
+                    fh.flush()
+        except OSError as e:
+            print(f"Trace archive {path} could not be written: {e}")
+            # Keep consuming blocks so that close() does not wait forever
+            while blocks.get() is not None:
+                pass
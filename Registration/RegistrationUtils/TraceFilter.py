@@ -0,0 +1,126 @@
+import math
+
+
+class TraceAcquisitionFilter:
+    """Keep only informative pointer samples while tracing the skin surface.
+
+    A sample is rejected when:
+
+    - it is closer than ``minSpacing`` to a point already in the trace. Points are kept in a
+      voxel hash of ``minSpacing`` sized cells, so only the 27 neighboring cells are searched;
+    - the pointer moves faster than ``maxVelocity`` since the previous sample, as fast sweeps
+      lift the tip off the skin and are blurred by the tracker;
+    - it is farther than ``maxSkinDistance`` from the skin, according to ``skinDistance``, a
+      function returning the distance of a point to the skin model, with the registration
+      applied. This rejects samples taken off the skin, e.g. on hair or drapes. The threshold
+      must exceed the registration error, or correct samples are rejected too: it is raised to
+      :attr:`skinDistanceFloor`, e.g. set from the registration error, unless the check is disabled;
+    - its ``regionSize`` cube already holds ``regionBudget`` points, so that a region traced
+      over and over does not outweigh the rest of the surface in ICP.
+
+    Setting a threshold to 0 disables the corresponding check. Distances are in mm, velocity
+    in mm/s and timestamps in seconds.
+    """
+
+    DEFAULT_MIN_SPACING = 2.0
+    DEFAULT_MAX_VELOCITY = 300.0
+    DEFAULT_REGION_SIZE = 20.0
+    DEFAULT_REGION_BUDGET = 100
+    DEFAULT_MAX_SKIN_DISTANCE = 5.0
+
+    def __init__(self, minSpacing=DEFAULT_MIN_SPACING, maxVelocity=DEFAULT_MAX_VELOCITY, regionSize=DEFAULT_REGION_SIZE, regionBudget=DEFAULT_REGION_BUDGET, maxSkinDistance=DEFAULT_MAX_SKIN_DISTANCE, skinDistance=None):
+        self.minSpacing = minSpacing
+        self.maxVelocity = maxVelocity
+        self.regionSize = regionSize
+        self.regionBudget = regionBudget
+        self.maxSkinDistance = maxSkinDistance
+        self.skinDistance = skinDistance
+        self.skinDistanceFloor = 0.0
+        self.reset()
+
+    def reset(self, points=()):
+        """Forget all samples, then record ``points`` (e.g. the current trace) as accepted."""
+        # Voxel index -> accepted points in the voxel
+        self.voxels = {}
+        # Region index -> number of accepted points in the region
+        self.regionCounts = {}
+        self.statistics = {"accepted": 0, "tooClose": 0, "tooFast": 0, "offSkin": 0, "overBudget": 0}
+        self.startAcquisition()
+        for point in points:
+            self.insert(point)
+
+    def startAcquisition(self):
+        """Forget the previous sample, so the pointer motion between acquisitions is not gated."""
+        self.previousPoint = None
+        self.previousTimestamp = None
+
+    def voxelIndex(self, point, size):
+        return (math.floor(point[0] / size), math.floor(point[1] / size), math.floor(point[2] / size))
+
+    def insert(self, point):
+        """Record ``point`` as accepted, without gating it."""
+        point = (float(point[0]), float(point[1]), float(point[2]))
+        if self.minSpacing > 0:
+            self.voxels.setdefault(self.voxelIndex(point, self.minSpacing), []).append(point)
+        if self.regionBudget > 0:
+            region = self.voxelIndex(point, self.regionSize)
+            self.regionCounts[region] = self.regionCounts.get(region, 0) + 1
+        return point
+
+    def isTooFast(self, point, timestamp):
+        if self.maxVelocity <= 0 or self.previousPoint is None:
+            return False
+        dt = timestamp - self.previousTimestamp
+        if dt <= 0:
+            return False
+        return math.dist(point, self.previousPoint) > self.maxVelocity * dt
+
+    def isOffSkin(self, point):
+        if self.maxSkinDistance <= 0 or self.skinDistance is None:
+            return False
+        return self.skinDistance(point) > max(self.maxSkinDistance, self.skinDistanceFloor)
+
+    def isTooClose(self, point):
+        if self.minSpacing <= 0:
+            return False
+        minSpacing2 = self.minSpacing * self.minSpacing
+        i, j, k = self.voxelIndex(point, self.minSpacing)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for dk in (-1, 0, 1):
+                    for other in self.voxels.get((i + di, j + dj, k + dk), ()):
+                        dx = point[0] - other[0]
+                        dy = point[1] - other[1]
+                        dz = point[2] - other[2]
+                        if dx * dx + dy * dy + dz * dz < minSpacing2:
+                            return True
+        return False
+
+    def isOverBudget(self, point):
+        return self.regionBudget > 0 and self.regionCounts.get(self.voxelIndex(point, self.regionSize), 0) >= self.regionBudget
+
+    @property
+    def rejectedCount(self):
+        return sum(count for reason, count in self.statistics.items() if reason != "accepted")
+
+    def accept(self, point, timestamp):
+        """Return True if the sample ``point`` taken at ``timestamp`` should be added to the trace."""
+        point = (float(point[0]), float(point[1]), float(point[2]))
+        tooFast = self.isTooFast(point, timestamp)
+        self.previousPoint = point
+        self.previousTimestamp = timestamp
+        if tooFast:
+            self.statistics["tooFast"] += 1
+            return False
+        if self.isTooClose(point):
+            self.statistics["tooClose"] += 1
+            return False
+        if self.isOffSkin(point):
+            self.statistics["offSkin"] += 1
+            return False
+        if self.isOverBudget(point):
+            self.statistics["overBudget"] += 1
+            return False
+        self.insert(point)
+        self.statistics["accepted"] += 1
+        return True
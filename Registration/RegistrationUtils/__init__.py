@@ -1,2 +1,9 @@
+from .Coverage import *  # noqa: F401
+from .PointerTip import *  # noqa: F401
+from .PoseFilter import *  # noqa: F401
+from .Residuals import *  # noqa: F401
 from .Tools import *  # noqa: F401
+from .ToolStatistics import *  # noqa: F401
 from .Trace import *  # noqa: F401
+from .TraceArchive import *  # noqa: F401
+from .TraceFilter import *  # noqa: F401